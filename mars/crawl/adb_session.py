@@ -0,0 +1,244 @@
+import atexit
+import os
+import re
+import select
+import subprocess
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import crawl.errors as errors
+
+SHELL_COMMAND_TIMEOUT = 60.0
+READ_CHUNK_SIZE = 65536
+
+
+class AdbShellSession:
+    """
+    A long-lived `adb shell` channel to a single device. Commands are written to the shell's
+    stdin one at a time, and the end of each command's output is marked by a unique sentinel
+    line carrying the command's exit status.
+    """
+
+    def __init__(self, device: str) -> None:
+        self.device = device
+        self.proc: Optional[subprocess.Popen] = None
+        self.buffer = b""
+        self.lock = threading.Lock()
+
+    def connect(self) -> None:
+        self.close()
+        self.proc = subprocess.Popen(
+            ["adb", "-s", self.device, "shell"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.buffer = b""
+
+    def close(self) -> None:
+        if self.proc is None:
+            return
+        try:
+            if self.proc.stdin:
+                self.proc.stdin.close()
+        except OSError:
+            pass
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        if self.proc.stdout:
+            self.proc.stdout.close()
+        self.proc = None
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def run(
+        self, command: str, timeout: Optional[float] = SHELL_COMMAND_TIMEOUT
+    ) -> Tuple[str, int]:
+        with self.lock:
+            try:
+                return self._run(command, timeout)
+            except errors.AdbSessionWriteError:
+                # The channel dropped (device reconnected, adb server restarted, ...) before
+                # the command reached the device. Reopen it and retry the command once. A
+                # channel that drops later is not retried, since the device may already
+                # have run the command.
+                self.connect()
+                return self._run(command, timeout)
+
+    def run_batch(
+        self, commands: List[str], timeout: Optional[float] = SHELL_COMMAND_TIMEOUT
+    ) -> List[Tuple[str, int]]:
+        # Runs every command in one round trip. Each command's output is followed by a marker
+        # line with its own exit status, so results can be split apart afterwards.
+        marker = f"__MARS_{uuid.uuid4().hex}__"
+        script = "".join(
+            f"{{ {command}\n}} </dev/null 2>&1; printf '\\n%s %d\\n' {marker} $?\n"
+            for command in commands
+        )
+        output, _ = self.run(script, timeout)
+
+        results = []
+        start = 0
+        for match in re.finditer(rf"\n{marker} (-?\d+)\n", output):
+            results.append((output[start : match.start()], int(match.group(1))))
+            start = match.end()
+        if len(results) != len(commands):
+            raise errors.AdbSessionError(f"{self.device}: incomplete batch output")
+        return results
+
+    def _run(self, command: str, timeout: Optional[float]) -> Tuple[str, int]:
+        if not self.is_alive():
+            self.connect()
+        assert self.proc is not None and self.proc.stdin is not None
+
+        sentinel = f"__MARS_{uuid.uuid4().hex}__"
+        script = f"{{ {command}\n}} </dev/null 2>&1; printf '\\n%s %d\\n' {sentinel} $?\n"
+        try:
+            self.proc.stdin.write(script.encode("utf-8"))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.close()
+            raise errors.AdbSessionWriteError(self.device)
+
+        try:
+            output, returncode = self._read_until_sentinel(sentinel, timeout)
+        except BaseException:
+            # Interrupted mid-command (timeout, alarm, stop signal, ...), so the rest of its
+            # output would be attributed to the next command. Drop the channel instead.
+            self.close()
+            raise
+        return output.decode("utf-8", errors="replace"), returncode
+
+    def _read_until_sentinel(self, sentinel: str, timeout: Optional[float]) -> Tuple[bytes, int]:
+        assert self.proc is not None and self.proc.stdout is not None
+        pattern = re.compile(rb"\n" + sentinel.encode("utf-8") + rb" (-?\d+)\n")
+        fd = self.proc.stdout.fileno()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            match = pattern.search(self.buffer)
+            if match:
+                output = self.buffer[: match.start()]
+                self.buffer = self.buffer[match.end() :]
+                return output, int(match.group(1))
+
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                raise errors.AdbTimeoutError(f"{self.device}: {sentinel}")
+            chunk = os.read(fd, READ_CHUNK_SIZE)
+            if not chunk:
+                raise errors.AdbSessionClosedError(self.device)
+            self.buffer += chunk
+
+
+class DeviceBackend:
+    """
+    Stands in for a device's adb shell, e.g. to crawl a simulated device. Registered backends
+    receive every shell and exec-out command sent to their device through this module.
+    """
+
+    # Where adb_utils taps to request a view hierarchy dump
+    access_button = (-1, -1)
+
+    def run(self, command: str) -> Tuple[str, int]:
+        raise NotImplementedError
+
+    def exec_out(self, command: str) -> bytes:
+        raise NotImplementedError
+
+
+_backends: Dict[str, DeviceBackend] = {}
+
+
+def register_backend(device: str, backend: DeviceBackend) -> None:
+    _backends[device] = backend
+
+
+def unregister_backend(device: str) -> None:
+    _backends.pop(device, None)
+
+
+def get_backend(device: str) -> Optional[DeviceBackend]:
+    return _backends.get(device)
+
+
+# Sessions are keyed by pid as well as device, since crawl workers are forked from the
+# controller process and must not share a shell channel with their parent.
+_sessions: Dict[Tuple[int, str], AdbShellSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(device: str) -> AdbShellSession:
+    key = (os.getpid(), device)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = AdbShellSession(device)
+            _sessions[key] = session
+    return session
+
+
+def close_session(device: str) -> None:
+    key = (os.getpid(), device)
+    with _sessions_lock:
+        session = _sessions.pop(key, None)
+    if session:
+        with session.lock:
+            session.close()
+
+
+def close_all_sessions() -> None:
+    pid = os.getpid()
+    with _sessions_lock:
+        keys = [key for key in _sessions if key[0] == pid]
+        sessions = [_sessions.pop(key) for key in keys]
+    for session in sessions:
+        with session.lock:
+            session.close()
+
+
+def shell(device: str, command: str, timeout: Optional[float] = SHELL_COMMAND_TIMEOUT) -> str:
+    output, _ = shell_with_status(device, command, timeout)
+    return output
+
+
+def shell_with_status(
+    device: str, command: str, timeout: Optional[float] = SHELL_COMMAND_TIMEOUT
+) -> Tuple[str, int]:
+    backend = _backends.get(device)
+    if backend is not None:
+        return backend.run(command)
+    return get_session(device).run(command, timeout)
+
+
+def shell_batch(
+    device: str, commands: List[str], timeout: Optional[float] = SHELL_COMMAND_TIMEOUT
+) -> List[Tuple[str, int]]:
+    backend = _backends.get(device)
+    if backend is not None:
+        return [backend.run(command) for command in commands]
+    return get_session(device).run_batch(commands, timeout)
+
+
+def exec_out(device: str, command: str, timeout: Optional[float] = SHELL_COMMAND_TIMEOUT) -> bytes:
+    # Binary-safe, so used for payloads that would not survive the line-framed shell channel
+    backend = _backends.get(device)
+    if backend is not None:
+        return backend.exec_out(command)
+    try:
+        proc = subprocess.run(
+            ["adb", "-s", device, "exec-out", command],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise errors.AdbTimeoutError(f"{device}: exec-out {command}")
+    return proc.stdout
+
+
+atexit.register(close_all_sessions)
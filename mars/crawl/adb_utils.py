@@ -2,42 +2,75 @@ import configparser
 import json
 import os
 import re
+import shlex
 import subprocess
 import time
-import uuid
 from typing import Dict, List, Optional, Union
 
+import crawl.adb_session as adb_session
+import crawl.clock as clock
+import crawl.errors as errors
+import crawl.metrics as metrics
+import crawl.packages as packages
+
+ONDEVICE_VIEW_PATH = "/sdcard/Android/data/com.android.accesspull/files/files/view.json"
+BANNED_PERMISSIONS = ["android.permission.MODIFY_AUDIO_SETTINGS"]
+
+
+def get_keycode_command(keycode: Union[int, str]) -> str:
+    return f"input keyevent {keycode}"
+
+
+def get_touch_command(x: int, y: int) -> str:
+    return f"input tap {x} {y}"
+
+
+def get_text_commands(text: str) -> List[str]:
+    text = text.replace(" ", "%s")
+    return [f"input text {shlex.quote(text)}", get_keycode_command("KEYCODE_ENTER")]
+
 
 def send_keycode_event(device: str, keycode: Union[int, str]) -> None:
-    subprocess.call([f"adb -s {device} shell input keyevent {keycode}"], shell=True)
+    adb_session.shell(device, get_keycode_command(keycode))
 
 
 def send_touch_event(device: str, x: int, y: int) -> None:
-    subprocess.call([f"adb -s {device} shell input tap {x} {y}"], shell=True)
+    adb_session.shell(device, get_touch_command(x, y))
 
 
 def send_text_event(device: str, text: str) -> None:
-    text = text.replace(" ", "%s")
-    subprocess.call([f'adb -s {device} shell input text "{text}"'], shell=True)
-    send_keycode_event(device, "KEYCODE_ENTER")
+    for command in get_text_commands(text):
+        adb_session.shell(device, command)
+
+
+def run_input_script(device: str, steps: List[List[str]], step_delay: float) -> None:
+    # Replays a sequence of input steps as a single device-side script, with a short sleep
+    # between steps instead of a host round trip and a full settle wait per step
+    commands = []
+    for i, step in enumerate(steps):
+        if i > 0:
+            commands.append(f"sleep {step_delay}")
+        commands.extend(step)
+    timeout = adb_session.SHELL_COMMAND_TIMEOUT + step_delay * len(steps)
+    with metrics.get_metrics(device).timer("input_script"):
+        adb_session.shell(device, "; ".join(commands), timeout=timeout)
 
 
 def clear_text_field(device: str) -> None:
     send_keycode_event(device, "KEYCODE_MOVE_END")
-    subprocess.call(
-        [
-            f'adb -s {device} shell input keyevent --longpress \
-                        $(printf "KEYCODE_DEL %.0s" {{1..250}});'
-        ],
-        shell=True,
-    )
+    keycodes = " ".join(["KEYCODE_DEL"] * 250)
+    adb_session.shell(device, f"input keyevent --longpress {keycodes}")
 
 
 def press_accessibility_button(device: str) -> None:
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    with open(os.path.join(dir_path, "access_button.json"), "r") as f:
-        data = json.load(f)
-    x, y = data[device]["x"], data[device]["y"]
+    backend = adb_session.get_backend(device)
+    if backend is not None:
+        x, y = backend.access_button
+    else:
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        with open(os.path.join(dir_path, "access_button.json"), "r") as f:
+            data = json.load(f)
+        x, y = data[device]["x"], data[device]["y"]
     send_touch_event(device, x, y)
 
 
@@ -51,68 +84,30 @@ def sync_accesspull_service(config: configparser.ConfigParser, device: str) -> N
         subprocess.call(
             [f"adb -s {device} install accesspull_v{required_accesspull_version}.apk"], shell=True,
         )
+        packages.invalidate(device, "com.android.accesspull")
 
 
 def enable_accesspull_service(device: str) -> None:
-    subprocess.call(
-        [
-            f"adb -s {device} shell settings put secure enabled_accessibility_services \
-                    com.android.accesspull/com.android.accesspull.AccessPullService"
-        ],
-        shell=True,
+    adb_session.shell(
+        device,
+        "settings put secure enabled_accessibility_services "
+        "com.android.accesspull/com.android.accesspull.AccessPullService",
     )
 
 
 def get_app_version_name(device: str, app: str) -> str:
-    proc = subprocess.Popen(
-        [f"adb -s {device} shell dumpsys package {app} | grep versionName"],
-        stdout=subprocess.PIPE,
-        stderr=None,
-        shell=True,
-    )
-    stdout, _ = proc.communicate()
-    versions = stdout.decode("utf-8").split("\n")
-    version = versions[0].strip().split("=")[1]
-    version = version.replace(" ", "")
-    version = version.replace("version", "")
-    version = version.replace("/", ".")
-    version = re.sub(r"\([^)]*\)", "", version)
-    return version
+    return packages.get_package_info(device, app).version_name
 
 
 def get_app_version_code(device: str, app: str) -> str:
-    proc = subprocess.Popen(
-        [f"adb -s {device} shell dumpsys package {app} | grep versionCode"],
-        stdout=subprocess.PIPE,
-        stderr=None,
-        shell=True,
-    )
-    stdout, _ = proc.communicate()
-    vers = stdout.decode("utf-8").split("\n")
-    vers = [ver for ver in vers if "=" in ver]
-    vcodes = [ver.strip().split(" ")[0].split("=")[1] for ver in vers]
-    latest_vcode = sorted(vcodes, reverse=True)[0]
-    return latest_vcode
+    version_code = packages.get_package_info(device, app).version_code
+    if not version_code:
+        raise Exception(f"{app} is not installed on {device}")
+    return version_code
 
 
 def get_requested_perms_of_installed_app(device: str, app: str) -> List[str]:
-    proc = subprocess.Popen(
-        [f"adb -s {device} shell dumpsys package {app} | grep permission"],
-        stdout=subprocess.PIPE,
-        stderr=None,
-        shell=True,
-    )
-    stdout, _ = proc.communicate()
-    lines = stdout.decode("ascii").split("\n")
-    lines = [p.strip() for p in lines]
-    try:
-        start = lines.index("requested permissions:")
-        end = lines.index("install permissions:")
-        permissions = lines[start + 1 : end]
-        permissions = [p.split(":")[0] for p in permissions]
-    except ValueError:
-        permissions = []
-    return permissions
+    return packages.get_package_info(device, app).requested_permissions
 
 
 def get_requested_perms_from_apk(apk_path: str) -> List[str]:
@@ -127,36 +122,46 @@ def get_requested_perms_from_apk(apk_path: str) -> List[str]:
     return permissions
 
 
+def get_grant_status(output: str, returncode: int) -> str:
+    return "FAILED" if "Security exception" in output or returncode != 0 else "GRANTED"
+
+
 def enable_permission(device: str, app: str, permission: str) -> str:
-    banned_permissions = ["android.permission.MODIFY_AUDIO_SETTINGS"]
-    if permission in banned_permissions:
+    if permission in BANNED_PERMISSIONS:
         return "BANNED"
-    proc = subprocess.Popen(
-        [f"adb -s {device} shell pm grant {app} {permission}"],
-        stdout=None,
-        stderr=subprocess.PIPE,
-        shell=True,
-    )
-    _, stderr = proc.communicate()
-    err_msg = stderr.decode("utf-8").split("\n")[0]
-    return "FAILED" if "Security exception" in err_msg else "GRANTED"
+    output, returncode = adb_session.shell_with_status(device, f"pm grant {app} {permission}")
+    packages.invalidate(device, app)
+    return get_grant_status(output, returncode)
+
+
+def prepare_device_for_app(
+    device: str, app: str, permissions: List[str], orientation: str = "portrait"
+) -> Dict[str, str]:
+    # Grants the app's permissions and resets the device for a crawl in one shell round trip.
+    # Returns the BANNED, FAILED or GRANTED status of every permission.
+    statuses = {permission: "BANNED" for permission in permissions}
+    grants = [permission for permission in permissions if permission not in BANNED_PERMISSIONS]
+    commands = [f"pm grant {app} {permission}" for permission in grants]
+    commands += [
+        f"rm -f {ONDEVICE_VIEW_PATH}",
+        "input keyevent KEYCODE_HOME",
+        "input keyevent 164",
+    ]
+    commands += get_rotation_commands(orientation)
+
+    results = adb_session.shell_batch(device, commands)
+    for permission, (output, returncode) in zip(grants, results):
+        statuses[permission] = get_grant_status(output, returncode)
+    packages.invalidate(device, app)
+    return statuses
 
 
 def reset_app_permissions(device: str, app: str, permission: Optional[str] = None) -> None:
     if permission:
-        subprocess.run(
-            [f"adb -s {device} shell pm revoke {app} {permission}"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.STDOUT,
-            shell=True,
-        )
+        adb_session.shell(device, f"pm revoke {app} {permission}")
     else:
-        subprocess.run(
-            [f"adb -s {device} shell pm reset-permissions -p {app}"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.STDOUT,
-            shell=True,
-        )
+        adb_session.shell(device, f"pm reset-permissions -p {app}")
+    packages.invalidate(device, app)
 
 
 def get_connected_devices() -> List[str]:
@@ -170,56 +175,115 @@ def get_connected_devices() -> List[str]:
 
 def unlock_device(device: str) -> None:
     while True:
-        screen_state = subprocess.check_output(
-            [f'adb -s {device} shell dumpsys nfc | grep "mScreenState="'], shell=True
-        ).decode("utf-8")
+        stdout = adb_session.shell(device, "dumpsys nfc")
+        screen_state = "\n".join(line for line in stdout.split("\n") if "mScreenState=" in line)
         if "OFF" in screen_state:
-            subprocess.call([f"adb -s {device} shell input keyevent 26"], shell=True)
-            subprocess.call([f"adb -s {device} shell input keyevent 82"], shell=True)
+            send_keycode_event(device, 26)
+            send_keycode_event(device, 82)
         if "ON_LOCKED" in screen_state:
-            subprocess.call([f"adb -s {device} shell input keyevent 82"], shell=True)
+            send_keycode_event(device, 82)
         else:
             break
 
 
+def probe_screen_state(device: str, timeout: float = 10.0) -> Optional[str]:
+    # Runs outside the persistent shell session, which may be held by a stuck crawl step.
+    # Returns None if the device does not answer in time, and an empty string if the screen
+    # state is unknown.
+    try:
+        proc = subprocess.run(
+            ["adb", "-s", device, "shell", "dumpsys nfc | grep mScreenState="],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return None
+    if proc.returncode not in (0, 1):
+        return None
+    return proc.stdout.decode("utf-8", errors="replace").strip()
+
+
 def reboot_device(device: str) -> None:
+    adb_session.close_session(device)
     subprocess.call([f"adb -s {device} reboot"], shell=True)
 
 
+def wait_for_boot(device: str, timeout: float = 300.0, poll_interval: float = 2.0) -> bool:
+    # Returns once the device is back on adb and has finished booting, instead of sleeping
+    # for a fixed time after a reboot
+    deadline = time.monotonic() + timeout
+    try:
+        subprocess.run(
+            ["adb", "-s", device, "wait-for-device"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return False
+    while time.monotonic() < deadline:
+        try:
+            if adb_session.shell(device, "getprop sys.boot_completed").strip() == "1":
+                return True
+        except errors.AdbSessionError:
+            # The shell channel drops while the device is still coming up
+            pass
+        time.sleep(poll_interval)
+    return False
+
+
 def mute_device(device: str) -> None:
     send_keycode_event(device, 164)
 
 
 def is_app_installed(device: str, app: str) -> bool:
-    is_installed = subprocess.check_output(
-        ["adb", "-s", device, "shell", "pm", "list", "packages", app]
-    ).decode("utf-8")
+    is_installed = adb_session.shell(device, f"pm list packages {app}")
     return is_installed != ""
 
 
 def uninstall_app(device: str, app: str) -> None:
     if is_app_installed(device, app):
         subprocess.call([f"adb -s {device} uninstall {app}"], stdout=subprocess.DEVNULL, shell=True)
+        packages.invalidate(device, app)
 
 
 def start_app(device: str, app: str) -> None:
-    subprocess.call(
-        [f"adb -s {device} shell monkey -p {app} 1"],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-        shell=True,
-    )
+    adb_session.shell(device, f"monkey -p {app} 1")
 
 
 def stop_app(device: str, app: str) -> None:
-    subprocess.call([f"adb -s {device} shell am force-stop {app}"], shell=True)
-
-
-def take_screenshot(device: str, savedir: str, filename: Optional[str] = None) -> None:
-    if not filename:
-        filename = uuid.uuid4().hex
-    saveto = os.path.join(savedir, filename) + ".png"
-    subprocess.call([f"adb -s {device} exec-out screencap -p > {saveto}"], shell=True)
+    adb_session.shell(device, f"am force-stop {app}")
+
+
+def capture_screenshot(device: str) -> bytes:
+    with metrics.get_metrics(device).timer("capture_screenshot"):
+        return adb_session.exec_out(device, "screencap -p")
+
+
+def get_window_focus(device: str) -> str:
+    return adb_session.shell(device, "dumpsys window | grep -E 'mCurrentFocus|mFocusedApp'").strip()
+
+
+def wait_for_ui_settle(
+    device: str, max_wait: float, quiet_period: float, poll_interval: float
+) -> float:
+    # Returns once the focused window has not changed for quiet_period seconds,
+    # or after max_wait seconds, whichever comes first.
+    start = clock.monotonic()
+    last_focus = None
+    stable_since = start
+    while clock.monotonic() - start < max_wait:
+        focus = get_window_focus(device)
+        now = clock.monotonic()
+        # A null focus means a window transition is still in progress
+        if focus != last_focus or "null" in focus:
+            last_focus = focus
+            stable_since = now
+        elif now - stable_since >= quiet_period:
+            break
+        clock.sleep(max(0.0, min(poll_interval, max_wait - (now - start))))
+    return clock.monotonic() - start
 
 
 def pull_file_from_device(device: str, filepath: str, saveto: str) -> None:
@@ -232,57 +296,31 @@ def pull_file_from_device(device: str, filepath: str, saveto: str) -> None:
 
 
 def remove_file_on_device(device: str, filepath: str) -> None:
-    subprocess.run(
-        [f"adb -s {device} shell rm -f {filepath}"],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-        shell=True,
-    )
-
+    adb_session.shell(device, f"rm -f {filepath}")
 
-def download_hierarchy(device: str, savedir: str, filename: Optional[str] = None) -> bool:
-    ondevice_file_path = "/sdcard/Android/data/com.android.accesspull/files/files/view.json"
-    if not filename:
-        filename = uuid.uuid4().hex
-    saveto = os.path.join(savedir, filename) + ".json"
 
+def capture_hierarchy(device: str) -> Optional[bytes]:
+    device_metrics = metrics.get_metrics(device)
     failed_count = 0
-    while True:
-        press_accessibility_button(device)
-        time.sleep(0.5)
-        try:
-            pull_file_from_device(device, ondevice_file_path, saveto)
-            remove_file_on_device(device, ondevice_file_path)
-            if os.stat(saveto).st_size > 0:
-                return True
+    with device_metrics.timer("capture_hierarchy"):
+        while True:
+            press_accessibility_button(device)
+            clock.sleep(0.5)
+            # Stream the dump and delete it on the device in a single round trip
+            view_data = adb_session.exec_out(
+                device, f"cat {ONDEVICE_VIEW_PATH} 2>/dev/null && rm -f {ONDEVICE_VIEW_PATH}"
+            )
+            if view_data:
+                return view_data
 
             failed_count += 1
+            device_metrics.increment("hierarchy_retries")
             if failed_count > 10:
-                return False
-        except FileNotFoundError:
-            failed_count += 1
-            if failed_count > 10:
-                return False
-
-
-def pull_state_info(config: configparser.ConfigParser, device: str, app: str) -> Optional[str]:
-    screen_uuid = uuid.uuid4().hex
-    savedir = os.path.join(config["crawl"]["views_path"], app)
-    view_success = download_hierarchy(device, savedir, screen_uuid)
-    if not view_success:
-        return None
-
-    savedir = os.path.join(config["crawl"]["screenshots_path"], app)
-    take_screenshot(device, savedir, screen_uuid)
-    return screen_uuid
+                return None
 
 
 def get_device_dims(device: str) -> Optional[Dict[str, int]]:
-    out = (
-        subprocess.run([f"adb -s {device} shell wm size"], shell=True, stdout=subprocess.PIPE)
-        .stdout.decode("utf-8")
-        .strip()
-    )
+    out = adb_session.shell(device, "wm size").strip()
     dims = re.search(r"(\d*)x(\d*)", out)
     if not dims:
         return None
@@ -314,24 +352,13 @@ def pull_apk_from_device(
     os.makedirs(savedir, exist_ok=True)
 
     # get absolute path to apk on the device
-    proc = subprocess.Popen(
-        [f'adb -s {device} shell pm path "{app}"'],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        shell=True,
-    )
-    stdout, _ = proc.communicate()
-    packages = []
-    for pkg in stdout.decode().split("\n"):
-        match = re.search(r"package:(\S*)", pkg)
-        if match:
-            packages.append(match.group(1))
+    package_info = packages.get_package_info(device, app)
     apk_path = ""
-    for package in packages:
+    for package in package_info.apk_paths:
         if "base" in package:
             apk_path = package
     if not apk_path:
-        apk_path = packages[0]
+        apk_path = package_info.apk_paths[0]
 
     version_code = get_app_version_code(device, app)
     apk_filename = os.path.join(savedir, f"{app}__{version_code}.apk")
@@ -349,51 +376,35 @@ def pull_apk_from_device(
 
 
 def open_playstore_install_page(device: str, app: str) -> None:
-    subprocess.call(
-        [
-            f"adb -s {device} shell am start -a android.intent.action.VIEW -d market://details?id={app}"
-        ],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        shell=True,
+    adb_session.shell(
+        device, f"am start -a android.intent.action.VIEW -d 'market://details?id={app}'"
     )
 
 
-def rotate_to_orientation(device: str, mode: Optional[str] = "portrait") -> None:
-    subprocess.call(
-        [
-            f"adb -s {device} shell content insert --uri content://settings/system --bind name:s:accelerometer_rotation --bind value:i:0"
-        ],
-        shell=True,
+def get_rotation_commands(mode: Optional[str] = "portrait") -> List[str]:
+    settings_insert = (
+        "content insert --uri content://settings/system --bind name:s:{} --bind value:i:{}"
     )
     if mode == "portrait":
-        subprocess.call(
-            [
-                f"adb -s {device} shell content insert --uri content://settings/system --bind name:s:user_rotation --bind value:i:0"
-            ],
-            shell=True,
-        )
+        user_rotation = 0
     elif mode == "landscape":
-        subprocess.call(
-            [
-                f"adb -s {device} shell content insert --uri content://settings/system --bind name:s:user_rotation --bind value:i:1"
-            ],
-            shell=True,
-        )
+        user_rotation = 1
     else:
         raise Exception(f"Invalid orientation: {mode}")
+    return [
+        settings_insert.format("accelerometer_rotation", 0),
+        settings_insert.format("user_rotation", user_rotation),
+    ]
+
+
+def rotate_to_orientation(device: str, mode: Optional[str] = "portrait") -> None:
+    for command in get_rotation_commands(mode):
+        adb_session.shell(device, command)
 
 
 def get_apps_installed(device: str) -> List[str]:
     # Returns all "user-installed" apps
-    proc = subprocess.Popen(
-        [f"adb -s {device} shell pm list packages -3'|cut -f 2 -d ':"],
-        stdout=subprocess.PIPE,
-        stderr=None,
-        shell=True,
-    )
-    stdout, _ = proc.communicate()
-    lines = stdout.decode("ascii").split("\n")
-    lines = [p.strip() for p in lines]
+    stdout = adb_session.shell(device, "pm list packages -3")
+    lines = [line.strip().split(":", 1)[-1] for line in stdout.split("\n")]
     apps = [line for line in lines if line != ""]
     return apps
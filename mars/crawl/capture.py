@@ -0,0 +1,47 @@
+import json
+import os
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Union
+
+
+@dataclass
+class Capture:
+    uuid: str
+    view_data: bytes
+    # May still be in flight, so the screenshot transfer overlaps with processing the view
+    screenshot: Union[bytes, "Future[bytes]", None] = None
+    _tree: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+    _parsed: bool = field(default=False, init=False, repr=False, compare=False)
+
+    @property
+    def tree(self) -> Optional[Dict[str, Any]]:
+        # Parsed at most once and shared by the state id, package check and action extraction
+        if not self._parsed:
+            try:
+                self._tree = json.loads(self.view_data)
+            except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+                self._tree = None
+            self._parsed = True
+        return self._tree
+
+    @property
+    def package_name(self) -> Optional[str]:
+        if self.tree is None:
+            return None
+        return str(self.tree["packageName"])
+
+    def get_screenshot(self) -> Optional[bytes]:
+        if isinstance(self.screenshot, Future):
+            return self.screenshot.result()
+        return self.screenshot
+
+    def save(self, views_dir: str, screenshots_dir: str) -> str:
+        treefile = os.path.join(views_dir, self.uuid) + ".json"
+        with open(treefile, "wb") as f:
+            f.write(self.view_data)
+        screenshot = self.get_screenshot()
+        if screenshot is not None:
+            with open(os.path.join(screenshots_dir, self.uuid) + ".png", "wb") as f:
+                f.write(screenshot)
+        return treefile
@@ -0,0 +1,52 @@
+import threading
+import time
+
+
+class Clock:
+    """
+    The time source of the crawl loop. Crawls against a simulated device swap in a
+    SimulatedClock, so waits cost no real time and latencies are measured in simulated time.
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class SimulatedClock(Clock):
+    def __init__(self, start: float = 0.0) -> None:
+        self.now = start
+        self.lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        with self.lock:
+            self.now += max(0.0, seconds)
+
+
+_clock = Clock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Clock) -> None:
+    global _clock
+    _clock = clock
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+
+def sleep(seconds: float) -> None:
+    _clock.sleep(seconds)
@@ -0,0 +1,242 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .crawl_controller import CrawlController
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, Any]) -> str:
+    return ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items())
+
+
+class PrometheusWriter:
+    """
+    Collects samples in the Prometheus text format. Samples are grouped under one HELP and
+    TYPE header per metric family, whatever order they are added in.
+    """
+
+    def __init__(self) -> None:
+        self.families: Dict[str, Tuple[str, str, List[str]]] = {}
+
+    def add(
+        self,
+        family: str,
+        metric_type: str,
+        help_text: str,
+        labels: Dict[str, Any],
+        value: float,
+        suffix: str = "",
+    ) -> None:
+        if family not in self.families:
+            self.families[family] = (metric_type, help_text, [])
+        self.families[family][2].append(f"{family}{suffix}{{{format_labels(labels)}}} {value}")
+
+    def render(self) -> str:
+        lines = []
+        for family, (metric_type, help_text, samples) in self.families.items():
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def format_prometheus(controller: "CrawlController") -> str:
+    writer = PrometheusWriter()
+    for worker in controller.workers:
+        labels = {"device": worker.device}
+        writer.add(
+            "mars_worker_info",
+            "gauge",
+            "Status and current app of the worker for a device.",
+            {
+                **labels,
+                "status": worker.get_status(),
+                "app": worker.get_app(),
+                "version": worker.get_version(),
+            },
+            1,
+        )
+        writer.add(
+            "mars_worker_queued_apps",
+            "gauge",
+            "Apps the worker can still claim.",
+            labels,
+            worker.get_num_queued(),
+        )
+
+        crawl_metrics = controller.get_worker_metrics(worker)
+        if not crawl_metrics:
+            continue
+        labels["app"] = crawl_metrics["app"]
+        recent_errors = crawl_metrics["recent_errors"]
+        writer.add(
+            "mars_crawl_recent_errors",
+            "gauge",
+            "Warnings and errors logged during the current crawl, up to the last few.",
+            labels,
+            len(recent_errors),
+        )
+        if recent_errors:
+            writer.add(
+                "mars_crawl_last_error_info",
+                "gauge",
+                "Most recent warning or error logged during the current crawl.",
+                {**labels, "message": recent_errors[-1]},
+                1,
+            )
+        for rate, value in sorted(crawl_metrics["rates"].items()):
+            writer.add(
+                "mars_crawl_rate",
+                "gauge",
+                "Events per minute since the current crawl started.",
+                {**labels, "rate": rate},
+                value,
+            )
+        for event, value in sorted(crawl_metrics["counters"].items()):
+            writer.add(
+                "mars_crawl_events_total",
+                "counter",
+                "Events counted during the current crawl.",
+                {**labels, "event": event},
+                value,
+            )
+        for phase, histogram in sorted(crawl_metrics["phases"].items()):
+            phase_labels = {**labels, "phase": phase}
+            help_text = "Time spent in each phase of the current crawl."
+            # Bounds are keys of the metrics file, so restore their numeric order
+            buckets = sorted(histogram["buckets"].items(), key=lambda item: float(item[0]))
+            for bound, count in buckets:
+                writer.add(
+                    "mars_crawl_phase_seconds",
+                    "histogram",
+                    help_text,
+                    {**phase_labels, "le": bound},
+                    count,
+                    suffix="_bucket",
+                )
+            writer.add(
+                "mars_crawl_phase_seconds",
+                "histogram",
+                help_text,
+                phase_labels,
+                histogram["sum"],
+                suffix="_sum",
+            )
+            writer.add(
+                "mars_crawl_phase_seconds",
+                "histogram",
+                help_text,
+                phase_labels,
+                histogram["count"],
+                suffix="_count",
+            )
+    return writer.render()
+
+
+def get_status(controller: "CrawlController") -> List[Dict[str, Any]]:
+    status = []
+    for worker in controller.workers:
+        crawl_metrics = controller.get_worker_metrics(worker)
+        status.append(
+            {
+                "device": worker.device,
+                "status": worker.get_status(),
+                "queued": worker.get_num_queued(),
+                "app": worker.get_app(),
+                "version": worker.get_version(),
+                "metrics": crawl_metrics,
+            }
+        )
+    return status
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /metrics and GET /status report every worker, in the Prometheus text format and as
+    JSON. POST /start/<target>, /stop/<target>, /reboot/<target> and /skip/<device> run the
+    same commands as the REPL, where a target is a device or "all".
+    """
+
+    server: "ControlHTTPServer"
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            self.send_body(200, PROMETHEUS_CONTENT_TYPE, format_prometheus(self.server.controller))
+        elif self.path == "/status":
+            self.send_json(200, get_status(self.server.controller))
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        controller = self.server.controller
+        commands = {
+            "start": controller.start_workers,
+            "stop": controller.stop_workers,
+            "skip": controller.skip_workers,
+            "reboot": controller.reboot_workers,
+        }
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] not in commands:
+            self.send_json(404, {"error": f"Unknown command {self.path}"})
+            return
+        command, target = parts
+        logging.info(f"Control server received {command} {target}")
+        if not commands[command](target):
+            self.send_json(400, {"error": f"Unrecognized target {target}"})
+            return
+        self.send_json(200, {"command": command, "target": target})
+
+    def send_json(self, code: int, body: Any) -> None:
+        self.send_body(code, "application/json", json.dumps(body, indent=2))
+
+    def send_body(self, code: int, content_type: str, body: str) -> None:
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Requests go to the crawl log instead of stderr, which is shared with the REPL
+        logging.debug(f"Control server: {format % args}")
+
+
+class ControlHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Any, controller: "CrawlController") -> None:
+        self.controller = controller
+        super().__init__(address, ControlRequestHandler)
+
+
+class ControlServer:
+    """
+    Serves the controller's status, metrics and commands over HTTP, on a background thread
+    beside the REPL, so a device farm can be scraped and driven without a terminal.
+    """
+
+    def __init__(self, controller: "CrawlController", host: str, port: int) -> None:
+        self.server = ControlHTTPServer((host, port), controller)
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode()
+        logging.info(f"Control server listening on http://{host}:{port}")
+
+    def shutdown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
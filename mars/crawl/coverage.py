@@ -0,0 +1,48 @@
+import collections
+from typing import Callable, Deque, Tuple
+
+from .clock import monotonic
+
+
+class CoverageMonitor:
+    """
+    Tracks how fast a crawl discovers new states and actions. A crawl has plateaued once it
+    has run for at least `window` seconds and found fewer than `min_rate` new states plus
+    new actions per minute over the last `window` seconds.
+    """
+
+    def __init__(
+        self, window: float, min_rate: float, clock: Callable[[], float] = monotonic
+    ) -> None:
+        self.window = window
+        self.min_rate = min_rate
+        self.clock = clock
+        self.start_time = clock()
+        # (timestamp, number of discoveries) for every step that discovered something
+        self.discoveries: Deque[Tuple[float, int]] = collections.deque()
+
+    def record_discovery(self, new_states: int, new_actions: int) -> None:
+        count = new_states + new_actions
+        if count > 0:
+            self.discoveries.append((self.clock(), count))
+
+    def get_discovery_rate(self) -> float:
+        # Discoveries per minute over the trailing window
+        now = self.clock()
+        while self.discoveries and self.discoveries[0][0] < now - self.window:
+            self.discoveries.popleft()
+        span = min(self.window, now - self.start_time)
+        if span <= 0:
+            return float("inf")
+        return 60 * sum(count for _, count in self.discoveries) / span
+
+    def has_plateaued(self) -> bool:
+        if self.window <= 0 or self.clock() - self.start_time < self.window:
+            return False
+        return self.get_discovery_rate() < self.min_rate
+
+    def describe(self) -> str:
+        return (
+            f"{self.get_discovery_rate():.2f} discoveries per minute "
+            f"over the last {self.window:.0f} seconds"
+        )
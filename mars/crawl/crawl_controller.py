@@ -4,32 +4,89 @@ import json
 import logging
 import multiprocessing as mp
 import os
-import queue
 import signal
 import sys
-import time
-from collections import defaultdict
-from typing import Any, Dict, List, NoReturn
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Sequence
 
-import dill
 from tqdm import tqdm
 
 import crawl.adb_utils as adb_utils
 import crawl.errors as errors
 import crawl.log_utils as log_utils
+import crawl.metrics as metrics
 import crawl.timeout as timeout
 import crawl.utils as utils
 
+from .control_server import ControlServer
 from .crawler import Crawler
+from .packages import PackageIndex
+from .task_board import Task, TaskBoard, order_longest_first
+from .watchdog import Watchdog
+
+
+def run_crawl(
+    config: configparser.ConfigParser,
+    device: str,
+    app: str,
+    on_crawler_created: Callable[[Crawler], None],
+) -> None:
+    crawl_instance: Optional[Crawler] = None
+    try:
+        # Restores any previous progress on this app from its crawl journal
+        crawl_instance = Crawler(config, device, app)
+        on_crawler_created(crawl_instance)
+
+        crawl_instance.prepare_device_for_crawl()
+        crawl_instance.crawl()
+    except TimeoutError:
+        logging.error(
+            f"[{device}] Crawl of {app} v{crawl_instance.version if crawl_instance else ''} "
+            f"exceeded {config['crawl'].getint('full_crawl_timeout')} seconds. Crawl stopped."
+        )
+    except errors.CoveragePlateauError as e:
+        logging.info(
+            f"[{device}] Crawl of {app} v{crawl_instance.version if crawl_instance else ''} "
+            f"plateaued at {e}. Crawl stopped."
+        )
+    except (KeyboardInterrupt, errors.CrawlStoppedError, errors.CrawlStalledError):
+        # Stalled crawls are skipped and logged by the watchdog that detected the stall
+        pass
+    except errors.MissingAccessibilityButtonError:
+        logging.error(
+            f"[{device}] Accessibility button missing or obstructed for "
+            f"{app} v{crawl_instance.version if crawl_instance else ''}. Crawl stopped."
+        )
+        reboot_and_wait(device)
+    except errors.DeviceUnresponsiveError:
+        reboot_and_wait(device)
+    except errors.AdbSessionError as e:
+        logging.error(
+            f"[{device}] Lost adb shell connection during crawl of "
+            f"{app} v{crawl_instance.version if crawl_instance else ''}: {e!r}. Crawl stopped."
+        )
+        # The watchdog may have asked for a reboot while the step was waiting on the device
+        if crawl_instance and crawl_instance.stall_action == "reboot":
+            reboot_and_wait(device)
+    finally:
+        if crawl_instance:
+            crawl_instance.on_crawl_terminate()
+
+
+def reboot_and_wait(device: str) -> None:
+    adb_utils.reboot_device(device)
+    if not adb_utils.wait_for_boot(device):
+        logging.error(f"[{device}] Device did not finish booting after reboot.")
 
 
 class CrawlWorker:
     def __init__(
-        self, config: configparser.ConfigParser, device: str, task_queue: mp.Queue, reset: bool,
+        self, config: configparser.ConfigParser, device: str, task_board: TaskBoard, reset: bool,
     ) -> None:
         self.config = config
         self.device = device
-        self.task_queue = task_queue
+        self.task_board = task_board
         self.reset = reset
 
         self.process = mp.Process(target=self.crawl_process)
@@ -47,12 +104,31 @@ class CrawlWorker:
         adb_utils.sync_accesspull_service(config, device)
         adb_utils.enable_accesspull_service(device)
 
+    def get_status(self) -> str:
+        return self.status.value.decode()
+
+    def get_app(self) -> str:
+        return self.app.value.decode()
+
+    def get_version(self) -> str:
+        return self.version.value.decode()
+
+    def get_pid(self) -> int:
+        return self.pid.value
+
+    def get_num_queued(self) -> int:
+        return self.task_board.get_num_claimable(self.device)
+
     def unlock(self) -> None:
         adb_utils.unlock_device(self.device)
 
     def reboot(self) -> None:
         adb_utils.reboot_device(self.device)
 
+    def wait_for_boot(self) -> None:
+        if not adb_utils.wait_for_boot(self.device):
+            print(f"{self.device} did not finish booting.")
+
     def mute(self) -> None:
         adb_utils.send_keycode_event(self.device, 164)
 
@@ -78,6 +154,10 @@ class CrawlWorker:
         self.stop()
         self.start()
 
+    def wait_for_stop(self) -> None:
+        # terminate() already ended the crawl process
+        pass
+
     def crawl_process(self) -> None:
         # Gracefully handle process killed with stop()
         # This allows the "finally" block to perform crawler cleanup
@@ -88,10 +168,12 @@ class CrawlWorker:
 
         self.pid.value = os.getpid()
         os.makedirs(self.crawlers_path, exist_ok=True)
+        # Started in the crawl process, since threads do not survive the fork
+        watchdog = Watchdog(self.config, self.device)
+        watchdog.start()
         while True:
-            try:
-                app = self.task_queue.get_nowait()
-            except queue.Empty:
+            app = self.task_board.claim(self.device)
+            if app is None:
                 adb_utils.send_keycode_event(self.device, "KEYCODE_HOME")
                 logging.info(f"All apps crawled on {self.device}")
                 self.status.value = b"finished"
@@ -105,36 +187,16 @@ class CrawlWorker:
             # os.makedirs(self.apks_path, exist_ok=True)
             # adb_utils.pull_apk_from_device(self.device, app, self.apks_path, verbose=False)
 
-            with timeout.Timeout(seconds=self.full_crawl_timeout):
-                try:
-                    crawler_checkpoint = f"{self.crawlers_path}/{app}.pkl"
-                    if os.path.exists(crawler_checkpoint):
-                        crawl_instance = dill.load(open(crawler_checkpoint, "rb"))
-                    else:
-                        crawl_instance = Crawler(self.config, self.device, app)
-
-                    self.app.value = crawl_instance.app.encode()
-                    self.version.value = crawl_instance.version.encode()
-
-                    crawl_instance.prepare_device_for_crawl()
-                    crawl_instance.crawl()
-                except TimeoutError:
-                    logging.error(
-                        f"[{self.device}] Crawl of {app} v{self.version.value.decode()} exceeded "
-                        f"{self.full_crawl_timeout} seconds. Crawl stopped."
-                    )
-                except KeyboardInterrupt:
-                    pass
-                except errors.MissingAccessibilityButtonError:
-                    logging.error(
-                        f"[{self.device}] Accessibility button missing or obstructed for "
-                        f"{app} v{self.version.value.decode()}. Crawl stopped."
-                    )
-                    self.reboot()
-                    time.sleep(60)
-                finally:
-                    crawl_instance.on_crawl_terminate()
-                    dill.dump(crawl_instance, open(crawler_checkpoint, "wb"))
+            def on_crawler_created(crawl_instance: Crawler) -> None:
+                self.app.value = crawl_instance.app.encode()
+                self.version.value = crawl_instance.version.encode()
+                watchdog.watch(crawl_instance)
+
+            try:
+                with timeout.Timeout(seconds=self.full_crawl_timeout):
+                    run_crawl(self.config, self.device, app, on_crawler_created)
+            finally:
+                watchdog.watch(None)
 
 
 class CrawlController:
@@ -143,48 +205,46 @@ class CrawlController:
         self.config = config
 
         self.devices = adb_utils.get_connected_devices()
-        self.workers = self.get_workers()
+        self.package_index = PackageIndex(self.devices)
+        # CrawlWorkers, or workers with the same methods for other engines
+        self.workers: List[Any] = self.get_workers()
+
+        # Warnings and errors are kept per device and reported by the status and /metrics
+        logging.getLogger().addHandler(metrics.ErrorLogHandler())
+        # Serializes commands from the REPL and the control server
+        self.command_lock = threading.Lock()
+        self.control_server = self.start_control_server()
         self.start_event_handler()
 
-    def init_tasks(self) -> Dict[str, mp.Queue]:
+    def init_task_board(self) -> TaskBoard:
+        # Shared with the crawl processes through a manager, so any idle worker can claim
+        # the next app installed on its device
+        self.manager = mp.Manager()
+        return TaskBoard(self.manager.list(self.get_tasks()), mp.Lock())
+
+    def get_tasks(self) -> List[Task]:
         if self.args.app:
             apps = [self.args.app]
         else:
             apps = self.get_apps_to_crawl()
 
-        task_queues: Dict[str, mp.Queue] = {device: mp.Queue() for device in self.devices}
         apps_missing = []
-        staging = defaultdict(list)
-        apps_on_mult = defaultdict(list)
+        tasks = []
         for app in tqdm(apps):
-            devices_with_app = []
-            for device in self.devices:
-                if adb_utils.is_app_installed(device, app):
-                    devices_with_app.append(device)
+            devices_with_app = self.package_index.get_devices_with_app(app)
             if len(devices_with_app) == 0:
                 apps_missing.append(app)
-            elif len(devices_with_app) == 1:
-                staging[devices_with_app[0]].append(app)
             else:
-                apps_on_mult[app] = devices_with_app
-
-        for app, devices in apps_on_mult.items():
-            device_with_fewest = min(
-                [(device, len(apps)) for device, apps in staging.items() if device in devices],
-                key=lambda x: x[1],
-            )[0]
-            staging[device_with_fewest].append(app)
-
-        for device, apps in staging.items():
-            for app in apps:
-                task_queues[device].put(app)
+                tasks.append((app, devices_with_app))
 
         if apps_missing:
             print(
                 f"These apps were not found on any connected device: "
                 f"{json.dumps(apps_missing, indent=2, sort_keys=True)}"
             )
-        return task_queues
+        crawl_times = log_utils.get_crawl_times_from_log(self.config)
+        full_crawl_timeout = self.config["crawl"].getint("full_crawl_timeout", fallback=300)
+        return order_longest_first(tasks, crawl_times, full_crawl_timeout)
 
     def get_apps_to_crawl(self) -> List[str]:
         if self.args.skip_list:
@@ -208,60 +268,140 @@ class CrawlController:
                 if app not in crawled_summary["completed"]
                 and app not in apps_skip
                 and app not in crawled_summary["timed_out"]
+                and app not in crawled_summary["plateaued"]
             ]
         return apps
 
-    def get_workers(self) -> List[CrawlWorker]:
-        task_queues = self.init_tasks()
-        workers = [
-            CrawlWorker(self.config, device, task_queues[device], self.args.reset)
-            for device in self.devices
-        ]
+    def get_workers(self) -> List[Any]:
+        task_board = self.init_task_board()
+        # Each worker syncs and enables the accessibility service on its device, which can
+        # include an APK install, so devices are brought up concurrently
+        with ThreadPoolExecutor(max_workers=max(1, len(self.devices))) as executor:
+            workers = list(
+                executor.map(
+                    lambda device: CrawlWorker(self.config, device, task_board, self.args.reset),
+                    self.devices,
+                )
+            )
         return workers
 
+    def run_on_workers(self, workers: Sequence[Any], func: Callable[[Any], None]) -> None:
+        with ThreadPoolExecutor(max_workers=max(1, len(workers))) as executor:
+            list(executor.map(func, workers))
+
+    def shutdown(self) -> None:
+        if self.control_server:
+            self.control_server.shutdown()
+
+    def start_control_server(self) -> Optional[ControlServer]:
+        # Off unless the config has a [control] section with a port
+        if not self.config.has_section("control"):
+            return None
+        port = self.config["control"].getint("port", fallback=0)
+        if port <= 0:
+            return None
+        control_server = ControlServer(
+            self, self.config["control"].get("host", fallback="127.0.0.1"), port
+        )
+        control_server.start()
+        return control_server
+
+    def get_target_workers(self, target: str, allow_all: bool = True) -> Optional[List[Any]]:
+        # Workers named by a command target, or None if the target is not recognized
+        if allow_all and target == "all":
+            return list(self.workers)
+        if target in self.devices:
+            return [w for w in self.workers if w.device == target]
+        return None
+
+    def get_worker_metrics(self, worker: Any) -> Optional[Dict[str, Any]]:
+        # Written by the crawler, which may run in another process
+        worker_metrics = metrics.read_metrics(
+            metrics.get_metrics_path(self.config["crawl"]["output_path"], worker.device)
+        )
+        if worker_metrics and worker_metrics["app"] == worker.get_app():
+            return worker_metrics
+        return None
+
+    # The start, stop, skip and reboot commands are shared by the REPL and the control
+    # server. Each returns False if its target is not recognized.
+
+    def start_workers(self, target: str) -> bool:
+        workers = self.get_target_workers(target)
+        if workers is None:
+            return False
+        with self.command_lock:
+            for worker in workers:
+                if worker.get_status() != "crawling":
+                    worker.start()
+        return True
+
+    def stop_workers(self, target: str) -> bool:
+        workers = self.get_target_workers(target)
+        if workers is None:
+            return False
+        with self.command_lock:
+            for worker in workers:
+                if worker.get_status() == "crawling":
+                    worker.stop()
+        # A crawl step can take minutes, and must not hold up commands for other devices
+        self.run_on_workers(workers, lambda w: w.wait_for_stop())
+        return True
+
+    def skip_workers(self, target: str) -> bool:
+        workers = self.get_target_workers(target, allow_all=False)
+        if workers is None:
+            return False
+        with self.command_lock:
+            for worker in workers:
+                if worker.get_status() == "crawling":
+                    worker.skip()
+        return True
+
+    def reboot_workers(self, target: str) -> bool:
+        workers = self.get_target_workers(target)
+        if workers is None:
+            return False
+        with self.command_lock:
+            for worker in workers:
+                if worker.get_status() == "crawling":
+                    worker.stop()
+        self.run_on_workers(workers, lambda w: w.wait_for_stop())
+        with self.command_lock:
+            self.run_on_workers(workers, lambda w: w.reboot())
+        # Booting takes minutes, and must not hold up commands for other devices
+        self.run_on_workers(workers, lambda w: w.wait_for_boot())
+        return True
+
     def start_event_handler(self) -> NoReturn:
         while True:
             try:
                 command = input("> ").strip().split(" ")
 
                 if command[0] == "exit":
-                    for worker in self.workers:
-                        if worker.status.value.decode() == "crawling":
-                            worker.stop()
+                    self.stop_workers("all")
+                    self.shutdown()
                     sys.exit()
 
                 if command[0] == "status":
                     if not self.devices:
                         print("No connected devices.")
 
-                    # qsize not implemented on OS X
-                    if sys.platform == "darwin":
-                        for worker in self.workers:
-                            print(
-                                f"[{worker.pid.value}] {worker.device} | {worker.status.value.decode()} | "
-                                f" {worker.app.value.decode()} | {worker.version.value.decode()}"
-                            )
-                    else:
-                        for worker in self.workers:
-                            print(
-                                f"[{worker.pid.value}] {worker.device} | "
-                                f"{worker.status.value.decode()} | {worker.task_queue.qsize()} | "
-                                f"{worker.app.value.decode()} | {worker.version.value.decode()}"
-                            )
+                    for worker in self.workers:
+                        print(
+                            f"[{worker.get_pid()}] {worker.device} | {worker.get_status()} | "
+                            f"{worker.get_num_queued()} | {worker.get_app()} | "
+                            f"{worker.get_version()}"
+                        )
+                        worker_metrics = self.get_worker_metrics(worker)
+                        if worker_metrics:
+                            print(f"    {metrics.describe(worker_metrics)}")
 
                 elif command[0] == "start":
                     if len(command) < 2:
                         print('start [all | "device"]')
                         continue
-                    if command[1] == "all":
-                        for worker in self.workers:
-                            if worker.status.value.decode() != "crawling":
-                                worker.start()
-                    elif command[1] in self.devices:
-                        worker = [w for w in self.workers if w.device == command[1]][0]
-                        if worker.status.value.decode() != "crawling":
-                            worker.start()
-                    else:
+                    if not self.start_workers(command[1]):
                         print(f'Unrecognized command: {" ".join(command)}')
                         continue
 
@@ -269,47 +409,28 @@ class CrawlController:
                     if len(command) < 2:
                         print('unlock [all | "device"]')
                         continue
-                    if command[1] == "all":
-                        for worker in self.workers:
-                            worker.unlock()
-                    elif command[1] in self.devices:
-                        worker = [w for w in self.workers if w.device == command[1]][0]
-                        worker.unlock()
-                    else:
+                    workers = self.get_target_workers(command[1])
+                    if workers is None:
                         print(f'Unrecognized command: {" ".join(command)}')
                         continue
+                    self.run_on_workers(workers, lambda w: w.unlock())
 
                 elif command[0] == "mute":
                     if len(command) < 2:
                         print('mute [all | "device"]')
                         continue
-                    if command[1] == "all":
-                        for worker in self.workers:
-                            worker.mute()
-                    elif command[1] in self.devices:
-                        worker = [w for w in self.workers if w.device == command[1]][0]
-                        worker.mute()
-                    else:
+                    workers = self.get_target_workers(command[1])
+                    if workers is None:
                         print(f'Unrecognized command: {" ".join(command)}')
                         continue
+                    for worker in workers:
+                        worker.mute()
 
                 elif command[0] == "reboot":
                     if len(command) < 2:
                         print('reboot [all | "device"]')
                         continue
-                    if command[1] == "all":
-                        for worker in self.workers:
-                            if worker.status.value.decode() == "crawling":
-                                worker.stop()
-                            worker.reboot()
-                        time.sleep(60)
-                    elif command[1] in self.devices:
-                        worker = [w for w in self.workers if w.device == command[1]][0]
-                        if worker.status.value.decode() == "crawling":
-                            worker.stop()
-                        worker.reboot()
-                        time.sleep(60)
-                    else:
+                    if not self.reboot_workers(command[1]):
                         print(f'Unrecognized command: {" ".join(command)}')
                         continue
 
@@ -317,15 +438,7 @@ class CrawlController:
                     if len(command) < 2:
                         print('stop [all | "device"]')
                         continue
-                    if command[1] == "all":
-                        for worker in self.workers:
-                            if worker.status.value.decode() == "crawling":
-                                worker.stop()
-                    elif command[1] in self.devices:
-                        worker = [w for w in self.workers if w.device == command[1]][0]
-                        if worker.status.value.decode() == "crawling":
-                            worker.stop()
-                    else:
+                    if not self.stop_workers(command[1]):
                         print(f'Unrecognized command: {" ".join(command)}')
                         continue
 
@@ -333,11 +446,7 @@ class CrawlController:
                     if len(command) < 2:
                         print('skip "device"')
                         continue
-                    if command[1] in self.devices:
-                        worker = [w for w in self.workers if w.device == command[1]][0]
-                        if worker.status.value.decode() == "crawling":
-                            worker.skip()
-                    else:
+                    if not self.skip_workers(command[1]):
                         print(f'Unrecognized command: {" ".join(command)}')
                         continue
                 else:
@@ -1,16 +1,28 @@
 import configparser
-import json
 import logging
 import os
-import time
+import random
+import threading
+import uuid
 from collections import defaultdict
-from typing import Dict, List, Optional, Set, Tuple, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import crawl.adb_utils as adb_utils
+import crawl.clock as clock
 import crawl.errors as errors
+import crawl.metrics as metrics
+import crawl.packages as packages
+import crawl.warm_start as warm_start
 
+from .capture import Capture
+from .coverage import CoverageMonitor
 from .graph_objects import Action, State
-from .xiaoyi_heuristics import get_xiaoyi_state_id
+from .journal import CrawlJournal, read_journal, write_graph
+from .routing import Router
+from .scheduling import get_scheduler
+from .writer import BackgroundWriter
+from .xiaoyi_heuristics import get_xiaoyi_state_id_for_capture
 
 
 class Crawler:
@@ -18,6 +30,9 @@ class Crawler:
         self.config = config
         self.device = device
         self.app = app
+        # The app may have been updated since it was cached, e.g. by the Play Store, and its
+        # version picks the journal to continue
+        packages.invalidate(device, app)
         self.version = adb_utils.get_app_version_code(device, app)
 
         self.views_dir = self.config["crawl"]["views_path"]
@@ -25,50 +40,319 @@ class Crawler:
         self.graphs_dir = self.config["crawl"]["graphs_path"]
         for d in [self.views_dir, self.screenshots_dir, self.graphs_dir]:
             os.makedirs(os.path.join(d, self.app), exist_ok=True)
+        os.makedirs(self.config["crawl"]["crawlers_path"], exist_ok=True)
 
         self.uuids: Dict[str, List[str]] = defaultdict(list)
         self.vertices: Dict[str, State] = {}
         self.edges: Dict[State, List[Tuple[Action, State]]] = defaultdict(list)
-        self.out_states: List[str] = []
+        self.out_states: Set[str] = set()
         self.global_explored_actions: Set[str] = set()
 
+        # Incrementally maintained action counts, and the states that still have unexplored
+        # actions, in the order they were found
+        self.num_unexplored_actions = 0
+        self.num_explored_actions = 0
+        self.frontier: Dict[str, State] = {}
+        self.router = Router(
+            default_latency=self.config["crawl"].getfloat("exec_action_delay", fallback=5)
+        )
+        self.scheduler = get_scheduler(self.config["crawl"].get("scheduler", fallback="priority"))
+        self.launch_latency: Optional[float] = None
+        self.total_action_latency = 0.0
+        self.num_timed_actions = 0
+
+        # Set by engines that run crawls in threads, where the crawl cannot be killed or
+        # interrupted by a signal. Both are checked before every step on the device.
+        self.stop_event: Optional[threading.Event] = None
+        self.deadline: Optional[float] = None
+
+        # Screenshots are transferred while the host processes the view hierarchy, and
+        # captures and journal records are written behind the crawl loop, in order
+        self.screenshot_pool = ThreadPoolExecutor(max_workers=1)
+        self.pending_screenshot: Optional["Future[bytes]"] = None
+        self.writer = BackgroundWriter(device)
+
+        # Ends the crawl early once it stops discovering new states and actions
+        self.coverage: Optional[CoverageMonitor] = None
+
+        # Per-phase timings and counters, periodically written to a per-device file
+        self.metrics = metrics.start_crawl_metrics(device, app, self.version)
+        self.metrics_path = metrics.get_metrics_path(self.config["crawl"]["output_path"], device)
+        self.metrics_interval = self.config["crawl"].getfloat("metrics_interval", fallback=30.0)
+        self.last_metrics_write = clock.monotonic()
+
+        # Progress and recovery requests shared with the worker's watchdog thread
+        self.last_progress_time = clock.monotonic()
+        self.stall_action: Optional[str] = None
+
+        # What a previous crawl, e.g. of an earlier version, learned about the app's screens
+        self.prior: Optional[warm_start.CrawlPrior] = None
+        self.warm_start_verify_only = (
+            self.config["crawl"].get("warm_start_mode", fallback="prioritize") == "verify"
+        )
+        warm_start_path = self.config["crawl"].get("warm_start_path", fallback="")
+        if warm_start_path:
+            self.load_prior(warm_start_path)
+
+        # Rebuild everything learned in previous runs, then keep appending to the same journal
+        self.journal: Optional[CrawlJournal] = None
+        self.journal_path = os.path.join(self.config["crawl"]["crawlers_path"], self.app) + ".jsonl"
+        self.restore_from_journal()
+        self.journal = CrawlJournal(self.journal_path)
+        self.journal.append("start", version=self.version)
+
+    def restore_from_journal(self) -> None:
+        records = list(read_journal(self.journal_path))
+        versions = [r["version"] for r in records if r["type"] == "start"]
+        if versions and versions[-1] != self.version:
+            stale_journal_path = os.path.join(
+                self.config["crawl"]["crawlers_path"], f"{self.app}__{versions[-1]}.jsonl"
+            )
+            os.replace(self.journal_path, stale_journal_path)
+            # graph.json is rewritten for the new version, so the previous one is kept apart
+            stale_graph_path = self.get_graph_path(f"graph__{versions[-1]}.json")
+            write_graph(stale_journal_path, stale_graph_path)
+            logging.info(
+                f"[{self.device}] {self.app} was updated from v{versions[-1]} to v{self.version}. "
+                f"Moved previous journal to {stale_journal_path} and its graph to "
+                f"{stale_graph_path}"
+            )
+            return
+        for record in records:
+            self.replay_record(record)
+
+    def load_prior(self, warm_start_path: str) -> None:
+        self.prior = warm_start.CrawlPrior.from_output_path(warm_start_path, self.app)
+        if self.prior is None:
+            logging.info(
+                f"[{self.device}] No previous crawl of {self.app} in {warm_start_path}. "
+                f"Crawling from scratch."
+            )
+            return
+        logging.info(
+            f"[{self.device}] Warm start of {self.app} v{self.version} from {warm_start_path}: "
+            f"{len(self.prior.outcomes)} known states, "
+            f"{self.prior.get_num_actions(warm_start.PRODUCTIVE)} productive, "
+            f"{self.prior.get_num_actions(warm_start.DEAD)} dead and "
+            f"{self.prior.get_num_actions(warm_start.OUT_OF_APP)} out-of-app actions"
+        )
+
+    def create_state(
+        self, treefile: str, state_id: str, capture: Optional[Capture] = None
+    ) -> State:
+        state = State(treefile=treefile, state_id=state_id, capture=capture)
+        # Applied on every creation, so restored states match. The skipped outcomes are only
+        # journaled for warm starts from this crawl, which would otherwise explore them again.
+        if self.prior is not None:
+            outcomes = self.prior.apply(state, verify_only=self.warm_start_verify_only)
+            for action_index, outcome in outcomes.items():
+                self.log_record("prior", src=state_id, index=action_index, outcome=outcome)
+        return state
+
+    def replay_record(self, record: Dict[str, Any]) -> None:
+        record_type = record["type"]
+        if record_type == "capture":
+            treefile = self.get_treefile(record["uuid"])
+            if record["state_id"] not in self.vertices and os.path.exists(treefile):
+                self.add_vertex(self.create_state(treefile, record["state_id"]))
+            return
+        if record_type == "launch":
+            if record["state_id"] in self.vertices:
+                self.record_launch(self.vertices[record["state_id"]], record["latency"])
+            return
+
+        state = self.vertices.get(record.get("src", ""))
+        if state is None:
+            return
+        if record_type == "back":
+            if record["dst"] is None:
+                self.record_back_exit(state)
+            elif record["dst"] in self.vertices:
+                self.record_back_edge(state, self.vertices[record["dst"]], record["latency"])
+            return
+
+        action_index = record["index"]
+        if action_index >= len(state.actions):
+            return
+        if record_type == "action":
+            self.global_explored_actions.add(state.actions[action_index].desc)
+        elif record_type == "disable":
+            self.disable_action(state, action_index)
+        elif record_type == "out":
+            self.record_out_state(
+                state, action_index, record["dst"], record["uuid"], record.get("package", "")
+            )
+        elif record_type == "edge":
+            if record["dst"] in self.vertices:
+                next_state = self.vertices[record["dst"]]
+                self.record_edge(state, action_index, next_state, record["latency"])
+
+    def log_record(self, record_type: str, **fields: Any) -> None:
+        if self.journal:
+            self.writer.submit(self.journal.append, record_type, **fields)
+
     def prepare_device_for_crawl(self) -> None:
-        ondevice_file_path = "/sdcard/Android/data/com.android.accesspull/files/files/view.json"
-        adb_utils.remove_file_on_device(self.device, ondevice_file_path)
-        self.grant_app_perms()
         adb_utils.unlock_device(self.device)
-        adb_utils.send_keycode_event(self.device, "KEYCODE_HOME")
-        adb_utils.mute_device(self.device)
-        adb_utils.rotate_to_orientation(self.device, "portrait")
+        # Permission grants, home, mute and rotation all go to the device as one batch
+        permissions = adb_utils.get_requested_perms_of_installed_app(self.device, self.app)
+        statuses = adb_utils.prepare_device_for_app(self.device, self.app, permissions, "portrait")
+        for permission, status in statuses.items():
+            logging.info(f"[{self.device}] {status} -- {permission}")
 
-    def on_crawl_terminate(self) -> None:
-        graph_filename = "graph.json"
-        graph_full_path = os.path.join(self.graphs_dir, self.app, graph_filename)
-        graph: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-        if os.path.exists(graph_full_path):
-            with open(graph_full_path, "r") as f:
-                prev_data = json.load(f)
-                graph.update(prev_data)
-        for src, act_state_pairs in self.edges.items():
-            for action, _ in act_state_pairs:
-                graph[src.uuid].append(action.as_dict())
-        with open(graph_full_path, "w") as out:
-            json.dump(graph, out, sort_keys=True, indent=2)
+    def get_graph_path(self, graph_filename: str = "graph.json") -> str:
+        return os.path.join(self.graphs_dir, self.app, graph_filename)
 
+    def on_crawl_terminate(self) -> None:
         self.log_status()
+        logging.info(
+            f"[{self.device}] Metrics for {self.app} v{self.version}: "
+            f"{metrics.describe(self.metrics.as_dict())}"
+        )
+        self.wait_for_pending_screenshot()
+        self.screenshot_pool.shutdown()
+        self.write_metrics()
+        # Failed writes were already logged one by one, and must not keep the journal open
+        writer_error: Optional[Exception] = None
+        try:
+            self.writer.close()
+        except Exception as e:
+            writer_error = e
+        if self.journal:
+            self.journal.close()
+        # The journal holds every run of this version, so the graph is written from it. A crawl
+        # that was killed before getting here can be written with scripts/write_graphs.py.
+        write_graph(self.journal_path, self.get_graph_path())
+        if writer_error is not None:
+            logging.error(
+                f"[{self.device}] Some captures or journal records of {self.app} "
+                f"v{self.version} were not written: {writer_error!r}"
+            )
         adb_utils.stop_app(self.device, self.app)
 
     def get_num_unexplored_actions(self) -> int:
-        return sum(len(state.get_unexplored_actions()) for state in self.vertices.values())
+        return self.num_unexplored_actions
 
     def get_num_explored_actions(self) -> int:
-        return sum(len(state.get_explored_actions()) for state in self.vertices.values())
+        return self.num_explored_actions
+
+    def add_vertex(self, state: State) -> None:
+        self.vertices[state.state_id] = state
+        self.num_unexplored_actions += len(state.unexplored_indices)
+        self.num_explored_actions += len(state.explored_indices)
+        if state.has_next_action():
+            self.frontier[state.state_id] = state
+
+    def update_action_counts(self, state: State, update: Callable[[], None]) -> None:
+        if self.vertices.get(state.state_id) is not state:
+            update()
+            return
+        num_unexplored = len(state.unexplored_indices)
+        num_explored = len(state.explored_indices)
+        update()
+        self.num_unexplored_actions += len(state.unexplored_indices) - num_unexplored
+        self.num_explored_actions += len(state.explored_indices) - num_explored
+        if not state.has_next_action():
+            self.frontier.pop(state.state_id, None)
+
+    def set_result_state(self, state: State, action_index: int, result_state: State) -> None:
+        self.update_action_counts(state, lambda: state.set_result_state(action_index, result_state))
+
+    def disable_action(self, state: State, action_index: int) -> None:
+        self.update_action_counts(state, lambda: state.disable_action(action_index))
+        self.log_record("disable", src=state.state_id, index=action_index)
+
+    def record_edge(
+        self, state: State, action_index: int, next_state: State, latency: float
+    ) -> None:
+        action = state.actions[action_index]
+        action.record_latency(latency)
+        self.total_action_latency += latency
+        self.num_timed_actions += 1
+        self.set_result_state(state, action_index, next_state)
+        self.edges[state].append((action, next_state))
+        self.router.add_edge(state, action, next_state)
+        self.last_progress_time = clock.monotonic()
+        self.metrics.increment("actions")
+        # Carries the action's graph.json entry, so the graph can be written from the journal.
+        # Back edges are logged as back records, and never show up in the graph, where they
+        # would count as reachability through the screen's elements.
+        self.log_record(
+            "edge",
+            src=state.state_id,
+            index=action_index,
+            dst=next_state.state_id,
+            latency=latency,
+            src_uuid=state.uuid,
+            action=action.as_dict(),
+        )
 
-    def grant_app_perms(self) -> None:
-        permissions = adb_utils.get_requested_perms_of_installed_app(self.device, self.app)
-        for permission in permissions:
-            status = adb_utils.enable_permission(self.device, self.app, permission)
-            logging.info(f"[{self.device}] {status} -- {permission}")
+    def record_out_state(
+        self, state: State, action_index: int, state_id: str, uuid: str, package_name: str
+    ) -> None:
+        # Screens outside the app are never written to disk or crawled, so skip action extraction
+        out_state = State(
+            treefile=self.get_treefile(uuid), state_id=state_id, extract_actions=False
+        )
+        self.set_result_state(state, action_index, out_state)
+        self.out_states.add(state_id)
+        self.metrics.increment("out_of_app")
+        # The package is what tells later warm starts that the action leaves the app
+        self.log_record(
+            "out",
+            src=state.state_id,
+            index=action_index,
+            dst=state_id,
+            uuid=uuid,
+            package=package_name,
+        )
+
+    def record_back_edge(self, state: State, back_state: State, latency: float) -> None:
+        back_action = state.get_back_action()
+        back_action.record_latency(latency)
+        back_action.result_state = back_state
+        self.edges[state].append((back_action, back_state))
+        self.router.add_edge(state, back_action, back_state)
+        self.log_record("back", src=state.state_id, dst=back_state.state_id, latency=latency)
+
+    def record_back_exit(self, state: State) -> None:
+        # Back leaves the app from this state, so it can never be used for navigation
+        state.get_back_action().priority = -100
+        self.log_record("back", src=state.state_id, dst=None)
+
+    def record_launch(self, state: State, latency: float) -> None:
+        self.router.set_root(state)
+        self.launch_latency = latency
+        self.log_record("launch", state_id=state.state_id, latency=latency)
+
+    def get_or_add_state(self, capture: Capture, state_id: str) -> State:
+        # Only captures of new states, and a sample of revisits, are screenshotted and stored.
+        # Captures that are unparseable or outside the app never reach this point.
+        is_new_state = state_id not in self.vertices
+        if not is_new_state and not self.should_store_revisit():
+            return self.vertices[state_id]
+
+        self.request_screenshot(capture)
+        treefile = self.get_treefile(capture.uuid)
+        self.writer.submit(self.save_capture, capture)
+        if is_new_state:
+            with self.metrics.timer("extract_actions"):
+                new_state = self.create_state(treefile, state_id, capture)
+            self.add_vertex(new_state)
+            self.last_progress_time = clock.monotonic()
+            self.metrics.increment("new_states")
+            if self.coverage:
+                self.coverage.record_discovery(1, len(new_state.unexplored_indices))
+        self.uuids[state_id].append(capture.uuid)
+        self.log_record("capture", uuid=capture.uuid, state_id=state_id)
+        return self.vertices[state_id]
+
+    def should_store_revisit(self) -> bool:
+        revisit_capture_rate = self.config["crawl"].getfloat("revisit_capture_rate", fallback=0.0)
+        return random.random() < revisit_capture_rate
+
+    def get_frontier_states(self) -> List[State]:
+        # In the order the states were found
+        return list(self.frontier.values())
 
     def log_status(self) -> None:
         num_states = len(self.vertices.keys())
@@ -79,81 +363,157 @@ class Crawler:
             f"States: {num_states}"
         )
 
+    def wait_for_device(self, delay: float) -> None:
+        # In adaptive mode, the configured delay is only an upper bound on the wait
+        with self.metrics.timer("wait"):
+            if self.config["crawl"].get("wait_mode", fallback="fixed") == "adaptive":
+                adb_utils.wait_for_ui_settle(
+                    self.device,
+                    max_wait=delay,
+                    quiet_period=self.config["crawl"].getfloat("settle_quiet_period", fallback=1.0),
+                    poll_interval=self.config["crawl"].getfloat(
+                        "settle_poll_interval", fallback=0.25
+                    ),
+                )
+            else:
+                clock.sleep(delay)
+
+    def begin_device_step(self) -> None:
+        self.check_interrupted()
+        self.wait_for_pending_screenshot()
+        if clock.monotonic() - self.last_metrics_write >= self.metrics_interval:
+            self.write_metrics()
+
+    def write_metrics(self) -> None:
+        self.last_metrics_write = clock.monotonic()
+        self.writer.submit(self.metrics.save, self.metrics_path)
+
+    def wait_for_pending_screenshot(self) -> None:
+        # Input changes the screen, so a screenshot still in flight must finish before it
+        if self.pending_screenshot is not None:
+            future, self.pending_screenshot = self.pending_screenshot, None
+            future.exception()
+
+    def pull_state_info(self) -> Optional[Capture]:
+        # Only the hierarchy; the screenshot is requested once the capture is known to be kept
+        view_data = adb_utils.capture_hierarchy(self.device)
+        if not view_data:
+            return None
+        self.metrics.increment("captures")
+        return Capture(uuid=uuid.uuid4().hex, view_data=view_data)
+
+    def request_screenshot(self, capture: Capture) -> None:
+        # The screen is unchanged until the next input, so the screenshot is transferred
+        # while the host extracts actions and picks the next step
+        self.pending_screenshot = self.screenshot_pool.submit(
+            adb_utils.capture_screenshot, self.device
+        )
+        capture.screenshot = self.pending_screenshot
+
+    def check_interrupted(self) -> None:
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise errors.CrawlStoppedError()
+        if self.deadline is not None and clock.monotonic() > self.deadline:
+            raise TimeoutError()
+        if self.coverage is not None and self.coverage.has_plateaued():
+            raise errors.CoveragePlateauError(self.coverage.describe())
+        if self.stall_action is not None:
+            stall_action, self.stall_action = self.stall_action, None
+            if stall_action == "relaunch":
+                raise errors.RelaunchRequestedError()
+            if stall_action == "skip":
+                raise errors.CrawlStalledError()
+            raise errors.DeviceUnresponsiveError()
+
+    def identify_capture(self, capture: Capture) -> Tuple[Optional[str], Optional[str]]:
+        with self.metrics.timer("identify"):
+            return get_xiaoyi_state_id_for_capture(capture), capture.package_name
+
+    def get_mean_latency(self) -> float:
+        if self.num_timed_actions == 0:
+            return self.config["crawl"].getfloat("exec_action_delay", fallback=5)
+        return self.total_action_latency / self.num_timed_actions
+
+    def get_launch_latency(self) -> float:
+        if self.launch_latency is None:
+            return self.config["crawl"].getfloat("start_app_delay", fallback=10)
+        return self.launch_latency
+
     def launch_app(self) -> State:
+        with self.metrics.timer("launch"):
+            next_state = self.start_app_and_capture()
+        self.metrics.increment("launches")
+        return next_state
+
+    def start_app_and_capture(self) -> State:
+        start_time = clock.monotonic()
         not_started_count = 0
         next_state = None
         while not next_state:
+            self.begin_device_step()
             adb_utils.send_keycode_event(self.device, "KEYCODE_HOME")
             adb_utils.stop_app(self.device, self.app)
             adb_utils.start_app(self.device, self.app)
-            time.sleep(2 * not_started_count + self.config["crawl"].getint("start_app_delay"))
-            uuid = adb_utils.pull_state_info(self.config, self.device, self.app)
-            if not uuid:
+            self.wait_for_device(
+                2 * not_started_count + self.config["crawl"].getint("start_app_delay")
+            )
+            capture = self.pull_state_info()
+            if not capture:
                 adb_utils.send_keycode_event(self.device, "KEYCODE_HOME")
-                home_test = adb_utils.pull_state_info(self.config, self.device, self.app)
+                home_test = self.pull_state_info()
                 # TODO(Raymond): Does this "home test" make sense? Check logic.
                 if not home_test:
                     raise errors.MissingAccessibilityButtonError()
                 else:
                     continue
 
-            treefile = os.path.join(self.views_dir, self.app, uuid) + ".json"
-            screenshot = os.path.join(self.screenshots_dir, self.app, uuid) + ".png"
-            state_id = get_xiaoyi_state_id(treefile)
+            state_id, package_name = self.identify_capture(capture)
             if not state_id:
-                os.remove(treefile)
-                os.remove(screenshot)
                 continue
 
-            if not self.is_crawl_in_correct_app(treefile):
+            if not self.is_crawl_in_correct_app(package_name):
                 logging.info(f"[{self.device}] App {self.app} not started yet.")
-                os.remove(treefile)
-                os.remove(screenshot)
                 not_started_count += 1
                 continue
 
-            if state_id not in self.vertices:
-                next_state = State(treefile=treefile, state_id=state_id)
-                self.vertices[state_id] = next_state
-            else:
-                next_state = self.vertices[state_id]
-        self.uuids[state_id].append(uuid)
+            next_state = self.get_or_add_state(capture, state_id)
+        self.record_launch(next_state, clock.monotonic() - start_time)
         return next_state
 
     def take_action(self, state: State, action_index: int) -> State:
         # TODO(Raymond): Refactor this action_index thing...
+        self.begin_device_step()
         action = state.actions[action_index]
+        start_time = clock.monotonic()
         action.execute(self.device)
         self.global_explored_actions.add(action.desc)
+        self.log_record("action", src=state.state_id, index=action_index)
 
         back_clicked_count = 0
         next_state = None
         while not next_state:
-            time.sleep(self.config["crawl"].getint("exec_action_delay"))
-            uuid = adb_utils.pull_state_info(self.config, self.device, self.app)
-            if not uuid:
-                action.priority = -100
+            # Unparseable captures and back presses can keep this loop going for a while
+            self.check_interrupted()
+            self.wait_for_device(self.config["crawl"].getint("exec_action_delay", fallback=5))
+            capture = self.pull_state_info()
+            if not capture:
+                self.disable_action(state, action_index)
                 return self.launch_app()
 
-            treefile = os.path.join(self.views_dir, self.app, uuid) + ".json"
-            screenshot = os.path.join(self.screenshots_dir, self.app, uuid) + ".png"
-            state_id = get_xiaoyi_state_id(treefile)
+            state_id, package_name = self.identify_capture(capture)
             if not state_id:
-                os.remove(treefile)
-                os.remove(screenshot)
                 continue
 
-            if not self.is_crawl_in_correct_app(treefile):
+            if not self.is_crawl_in_correct_app(package_name):
                 logging.info(
                     f"[{self.device}] {self.app} v{self.version}: Crawl navigated outside package. Relaunching."
                 )
-                out_state = State(treefile=treefile, state_id=state_id)
-                state.set_result_state(action_index, out_state)
-                self.out_states.append(state_id)
-                os.remove(treefile)
-                os.remove(screenshot)
+                self.record_out_state(
+                    state, action_index, state_id, capture.uuid, package_name or ""
+                )
 
                 if back_clicked_count < 3:
+                    self.wait_for_pending_screenshot()
                     adb_utils.send_keycode_event(self.device, "KEYCODE_BACK")
                     back_clicked_count += 1
                     continue
@@ -165,66 +525,89 @@ class Crawler:
                 f"from {state.state_id} to {state_id}"
             )
 
-            if state_id not in self.vertices:
-                next_state = State(treefile=treefile, state_id=state_id)
-                self.vertices[state_id] = next_state
-            else:
-                next_state = self.vertices[state_id]
+            next_state = self.get_or_add_state(capture, state_id)
 
         if back_clicked_count == 0:
-            state.set_result_state(action_index, next_state)
-            self.uuids[state_id].append(uuid)
-            self.edges[state].append((action, next_state))
+            self.record_edge(state, action_index, next_state, clock.monotonic() - start_time)
         return next_state
 
-    def is_crawl_in_correct_app(self, jsonfile: str) -> bool:
-        with open(jsonfile, "r") as f:
-            data = json.load(f)
-            return str(data["packageName"]) == self.app
+    def is_crawl_in_correct_app(self, package_name: Optional[str]) -> bool:
+        return package_name == self.app
 
-    def get_next_states(self, cur_state: State) -> List[State]:
-        states = []
+    def get_treefile(self, uuid: str) -> str:
+        return os.path.join(self.views_dir, self.app, uuid) + ".json"
 
-        # First, try to get next state that can be reached from the current state AND has an action
-        for state in cur_state.get_children():
-            if state.state_id not in self.out_states:
-                if state.has_next_action():
-                    states.append(state)
+    def save_capture(self, capture: Capture) -> str:
+        with self.metrics.timer("save_capture"):
+            return capture.save(
+                os.path.join(self.views_dir, self.app),
+                os.path.join(self.screenshots_dir, self.app),
+            )
 
-        # Second, get any state has an action
-        if not states:
-            for state in self.vertices.values():
-                if state.has_next_action():
-                    states.append(state)
+    def get_next_states(self, cur_state: State) -> Iterable[State]:
+        return self.scheduler.get_next_states(self, cur_state)
+
+    def go_to_state(self, plan: List[Action], goal_state: State) -> State:
+        with self.metrics.timer("replay"):
+            if self.config["crawl"].get("replay_mode", fallback="step") == "macro":
+                return self.replay_path(plan, goal_state)
+            for action in plan:
+                self.begin_device_step()
+                action.execute(self.device)
+                self.wait_for_device(self.config["crawl"].getint("exec_action_delay", fallback=5))
+            return goal_state
+
+    def replay_path(self, plan: List[Action], goal_state: State) -> State:
+        # Every step but the last only waits replay_step_delay on the device, so the final
+        # screen is captured to check that the replay actually reached the goal
+        self.begin_device_step()
+        step_delay = self.config["crawl"].getfloat("replay_step_delay", fallback=1.0)
+        adb_utils.run_input_script(
+            self.device, [action.get_commands() for action in plan], step_delay
+        )
+        self.wait_for_device(self.config["crawl"].getint("exec_action_delay", fallback=5))
 
-        return sorted(states, key=lambda s: s.priority, reverse=True)
+        capture = self.pull_state_info()
+        if not capture:
+            return self.launch_app()
+        state_id, package_name = self.identify_capture(capture)
+        if state_id == goal_state.state_id:
+            return goal_state
 
-    def go_to_state(self, plan: List[Action]) -> None:
-        for action in plan:
-            action.execute(self.device)
-            time.sleep(self.config["crawl"].getint("exec_action_delay"))
+        logging.info(
+            f"[{self.device}] {self.app} v{self.version}: Replay to {goal_state.state_id} "
+            f"ended in {state_id}"
+        )
+        if state_id and self.is_crawl_in_correct_app(package_name):
+            return self.get_or_add_state(capture, state_id)
+        return self.launch_app()
 
     def get_path_between_states(self, start_state: State, goal_state: State) -> List[Action]:
-        visited = set()
-        queue = []
-
-        for action_state in self.edges[start_state]:
-            visited.add(action_state[1])
-            queue.append([action_state])
-
-        while queue:
-            path = queue.pop(0)
-            _, state = path[-1]
-            if state == goal_state:
-                actions = [action_state[0] for action_state in path]
-                return actions
-            for action_state in self.edges[state]:
-                if action_state[1] not in visited:
-                    visited.add(action_state[1])
-                    new_path = list(path)
-                    new_path.append(action_state)
-                    queue.append(new_path)
-        return []
+        return self.router.find_path(start_state, goal_state)
+
+    def learn_back_edge(self, state: State) -> Optional[State]:
+        self.begin_device_step()
+        back_action = state.get_back_action()
+        start_time = clock.monotonic()
+        back_action.execute(self.device)
+        self.wait_for_device(self.config["crawl"].getint("exec_action_delay", fallback=5))
+        capture = self.pull_state_info()
+        if not capture:
+            return None
+        state_id, package_name = self.identify_capture(capture)
+        if not state_id:
+            return None
+        if not self.is_crawl_in_correct_app(package_name):
+            self.record_back_exit(state)
+            return None
+
+        back_state = self.get_or_add_state(capture, state_id)
+        logging.info(
+            f"[{self.device}] {self.app} v{self.version}: learned back edge "
+            f"from {state.state_id} to {state_id}"
+        )
+        self.record_back_edge(state, back_state, clock.monotonic() - start_time)
+        return back_state
 
     def crawl_from_state(self, state: State) -> State:
         while state.has_next_action():
@@ -233,24 +616,36 @@ class Crawler:
         logging.info(
             f"[{self.device}] {self.app} v{self.version}: {state.state_id} has no more unexplored actions"
         )
-        time.sleep(2)
+        clock.sleep(2)
         return state
 
     def prepare_state_for_crawl(self, cur_state: State) -> Optional[State]:
-        next_states = self.get_next_states(cur_state)
-        while next_states:
-            next_state = next_states.pop(0)
+        max_back_steps = self.config["crawl"].getint("max_back_steps", fallback=3)
+        for next_state in self.get_next_states(cur_state):
 
             if cur_state == next_state:
                 return next_state
 
             plan = self.get_path_between_states(cur_state, next_state)
+
+            # Before paying for a relaunch, learn where back leads from states we have not
+            # pressed it on yet. The learned edges are reused by every later plan.
+            back_count = 0
+            while not plan and back_count < max_back_steps and cur_state.can_learn_back():
+                back_state = self.learn_back_edge(cur_state)
+                back_count += 1
+                if not back_state:
+                    break
+                cur_state = back_state
+                if cur_state == next_state:
+                    return next_state
+                plan = self.get_path_between_states(cur_state, next_state)
+
             if plan:
                 logging.info(
                     f"[{self.device}] {self.app} v{self.version}: Going from {cur_state.state_id} to {next_state.state_id}"
                 )
-                self.go_to_state(plan)
-                return next_state
+                return self.go_to_state(plan, next_state)
 
             cur_state = self.launch_app()
             plan = self.get_path_between_states(cur_state, next_state)
@@ -258,8 +653,7 @@ class Crawler:
                 logging.info(
                     f"[{self.device}] {self.app} v{self.version}: Going from {cur_state.state_id} to {next_state.state_id}"
                 )
-                self.go_to_state(plan)
-                return next_state
+                return self.go_to_state(plan, next_state)
 
         if self.get_num_unexplored_actions() != 0:
             next_state = self.launch_app()
@@ -274,10 +668,22 @@ class Crawler:
             self.log_status()
         else:
             logging.info(f"[{self.device}] Starting crawl of {self.app} v{self.version}")
-        start_state = self.launch_app()
+        self.coverage = CoverageMonitor(
+            window=self.config["crawl"].getfloat("plateau_window", fallback=0),
+            min_rate=self.config["crawl"].getfloat("plateau_min_rate", fallback=1.0),
+        )
+        start_state: Optional[State] = None
         while True:
-            end_state = self.crawl_from_state(start_state)
-            next_state = self.prepare_state_for_crawl(end_state)
+            try:
+                if start_state is None:
+                    start_state = self.launch_app()
+                end_state = self.crawl_from_state(start_state)
+                next_state = self.prepare_state_for_crawl(end_state)
+            except errors.RelaunchRequestedError:
+                # Requested by the watchdog after a stall; the screen may have been locked
+                adb_utils.unlock_device(self.device)
+                start_state = None
+                continue
             if next_state:
                 start_state = next_state
             else:
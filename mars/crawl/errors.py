@@ -1,2 +1,38 @@
 class MissingAccessibilityButtonError(Exception):
     pass
+
+
+class AdbSessionError(Exception):
+    pass
+
+
+class AdbSessionClosedError(AdbSessionError):
+    pass
+
+
+class AdbSessionWriteError(AdbSessionClosedError):
+    pass
+
+
+class AdbTimeoutError(AdbSessionError):
+    pass
+
+
+class CrawlStoppedError(Exception):
+    pass
+
+
+class CoveragePlateauError(Exception):
+    pass
+
+
+class RelaunchRequestedError(Exception):
+    pass
+
+
+class CrawlStalledError(Exception):
+    pass
+
+
+class DeviceUnresponsiveError(Exception):
+    pass
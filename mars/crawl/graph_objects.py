@@ -1,16 +1,34 @@
 import json
 import os
+import re
 import string
 from collections import defaultdict
 from itertools import groupby
 from operator import itemgetter
-from typing import Any, Iterator, List, Optional, Set, Dict
+from typing import Any, Dict, List, Optional, Pattern, Set, Tuple
 
 import crawl.adb_utils as adb_utils
 import crawl.utils as utils
 
+from .capture import Capture
+
 
 class Action:
+    __slots__ = (
+        "desc",
+        "class_name",
+        "resource_id",
+        "action_type",
+        "input_type",
+        "bounds",
+        "result_state",
+        "priority",
+        "latency",
+        "touchx",
+        "touchy",
+        "text",
+    )
+
     text_input_map = {
         "search": "sushi",
         "location": "seattle",
@@ -44,20 +62,41 @@ class Action:
         self.bounds = bounds
         self.result_state = result_state
         self.priority = priority
+        self.latency: Optional[float] = None
         self.touchx, self.touchy = utils.get_touch_from_bounds(self.bounds)
         self.text = self.get_input_text()
 
     def as_dict(self) -> Dict[str, Any]:
-        r = {k: v for k, v in self.__dict__.items() if k != "result_state"}
+        r = {k: getattr(self, k) for k in Action.__slots__ if k != "result_state"}
         r["result_state"] = None if not self.result_state else self.result_state.state_id
         r["result_uuid"] = None if not self.result_state else self.result_state.uuid
         return r
 
+    def record_latency(self, latency: float) -> None:
+        # Exponential moving average with factor 0.5, so one slow transition does not dominate
+        # route planning and recent measurements weigh the most
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = (self.latency + latency) / 2
+
     def execute(self, device: str) -> None:
         if self.input_type == "touch":
             adb_utils.send_touch_event(device, self.touchx, self.touchy)
         elif self.input_type == "text":
             adb_utils.send_text_event(device, self.text)
+        elif self.input_type == "key":
+            adb_utils.send_keycode_event(device, self.desc)
+
+    def get_commands(self) -> List[str]:
+        # Device shell commands equivalent to execute(), for replaying paths as one script
+        if self.input_type == "touch":
+            return [adb_utils.get_touch_command(self.touchx, self.touchy)]
+        elif self.input_type == "text":
+            return adb_utils.get_text_commands(self.text)
+        elif self.input_type == "key":
+            return [adb_utils.get_keycode_command(self.desc)]
+        return []
 
     def get_input_text(self) -> str:
         if self.input_type == "text":
@@ -69,43 +108,80 @@ class Action:
             return ""
 
 
+def compile_word_matcher(words: List[str]) -> Pattern[str]:
+    # Matches a word, or a phrase of consecutive words, only as whole space-separated tokens
+    alternatives = "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+    return re.compile(rf"(?<![^ ])(?:{alternatives})(?![^ ])")
+
+
 class State:
-    def __init__(self, treefile: str, state_id: str, priority: Optional[int] = 0) -> None:
+    __slots__ = (
+        "treefile",
+        "uuid",
+        "state_id",
+        "priority",
+        "actions",
+        "unexplored_indices",
+        "explored_indices",
+        "back_action",
+    )
+
+    priority_words = {
+        "blacklist": [
+            "login",
+            "facebook",
+            "fb",
+            "gmail",
+            "error",
+            "share",
+            "call",
+            "sign out",
+            "log out",
+            "sign in",
+            "join",
+        ],
+        "negative": [
+            "dismiss",
+            "reject",
+            "skip",
+            "deny",
+            "no",
+            "never",
+            "cancel",
+            "later",
+            "close",
+            "finish",
+            "next",
+        ],
+        "positive": ["accept", "allow", "yes", "okay", "ok", "save"],
+    }
+    # Checked in order and the first match wins, so BLACKLIST words override POSITIVE words,
+    # which override NEGATIVE words.
+    priority_matchers: List[Tuple[Pattern[str], int]] = [
+        (compile_word_matcher(priority_words["blacklist"]), -1),
+        (compile_word_matcher(priority_words["positive"]), 5),
+        (compile_word_matcher(priority_words["negative"]), 10),
+    ]
+
+    def __init__(
+        self,
+        treefile: str,
+        state_id: str,
+        priority: Optional[int] = 0,
+        capture: Optional[Capture] = None,
+        extract_actions: bool = True,
+    ) -> None:
         self.treefile = treefile
         self.uuid = os.path.splitext(os.path.basename(treefile))[0]
         self.state_id = state_id
         self.priority = priority
-        self.priority_words = {
-            "blacklist": [
-                "login",
-                "facebook",
-                "fb",
-                "gmail",
-                "error",
-                "share",
-                "call",
-                "sign out",
-                "log out",
-                "sign in",
-                "join",
-            ],
-            "negative": [
-                "dismiss",
-                "reject",
-                "skip",
-                "deny",
-                "no",
-                "never",
-                "cancel",
-                "later",
-                "close",
-                "finish",
-                "next",
-            ],
-            "positive": ["accept", "allow", "yes", "okay", "ok", "save",],
-        }
         self.actions: List[Action] = []
-        self.init_actions()
+        self.unexplored_indices: Set[int] = set()
+        self.explored_indices: Set[int] = set()
+        self.back_action: Optional[Action] = None
+        if extract_actions:
+            self.init_actions(capture)
+            self.index_actions()
 
     def __hash__(self) -> int:
         return int(self.state_id, 16)
@@ -115,35 +191,31 @@ class State:
             return NotImplemented
         return self.state_id == other.state_id
 
-    def assign_priority_to_action(self, action: Action, prio_cls: str, priority: int) -> None:
-        def get_shingles(size: int, sent: List[str]) -> Iterator[Any]:
-            for i in range(0, len(sent) - size + 1):
-                yield tuple(sent[i : i + size])
-
-        action_text = action.desc.split(" ")
-        for prio_words in self.priority_words[prio_cls]:
-            words = prio_words.split(" ")
-            # single word
-            if len(words) == 1:
-                if words[0] in action_text:
-                    action.priority = priority
-            # phrase
-            else:
-                if len(words) <= len(action_text):
-                    if tuple(words) in get_shingles(len(words), action_text):
-                        action.priority = priority
+    def assign_priority_to_action(self, action: Action) -> None:
+        for matcher, priority in State.priority_matchers:
+            if matcher.search(action.desc):
+                action.priority = priority
+                return
+
+    def index_actions(self) -> None:
+        self.unexplored_indices = {
+            i for i, x in enumerate(self.actions) if x.priority >= 0 and not x.result_state
+        }
+        self.explored_indices = {
+            i for i, x in enumerate(self.actions) if x.priority >= 0 and x.result_state
+        }
 
     def get_unexplored_actions(self) -> List[int]:
-        return [i for i, x in enumerate(self.actions) if x.priority >= 0 and not x.result_state]
+        return sorted(self.unexplored_indices)
 
     def get_explored_actions(self) -> List[int]:
-        return [i for i, x in enumerate(self.actions) if x.priority >= 0 and x.result_state]
+        return sorted(self.explored_indices)
 
     def sort_actions_by_priority(self, action_indices: List[int]) -> List[int]:
         return sorted(action_indices, key=lambda i: self.actions[i].priority, reverse=True)
 
     def has_next_action(self) -> bool:
-        return len(self.get_unexplored_actions()) > 0
+        return len(self.unexplored_indices) > 0
 
     def get_next_action(self, global_explored_actions: Set[str]) -> int:
         # De-prioritize actions that have been seen before in any state
@@ -192,7 +264,7 @@ class State:
         actions = [self.actions[i] for i in action_indices]
         return [action.result_state for action in actions if action.result_state]
 
-    def init_actions(self) -> None:
+    def init_actions(self, capture: Optional[Capture] = None) -> None:
         def init_action_for_elem(elem: Any) -> None:
             if is_actionable(elem):
                 if not has_actionable_children(elem):
@@ -204,8 +276,12 @@ class State:
                     for child in elem["children"]:
                         init_action_for_elem(child)
 
-        with open(self.treefile, "r") as fp:
-            json_data = json.load(fp)
+        # Captures whose hierarchy could not be parsed fall back to reading the tree file
+        if capture is not None and capture.tree is not None:
+            json_data = capture.tree
+        else:
+            with open(self.treefile, "r") as fp:
+                json_data = json.load(fp)
         for elem in utils.bfs(json_data):
             init_action_for_elem(elem)
 
@@ -271,16 +347,39 @@ class State:
             result_state=None,
             priority=priority,
         )
-        # Give first priority to NEGATIVE words.
-        self.assign_priority_to_action(action, "negative", 10)
-        # Give second priority to POSITIVE words
-        self.assign_priority_to_action(action, "positive", 5)
-        # Give lowest priority to BLACKLIST words
-        self.assign_priority_to_action(action, "blacklist", -1)
+        self.assign_priority_to_action(action)
         return action
 
     def set_result_state(self, action_index: int, result_state: "State") -> None:
-        self.actions[action_index].result_state = result_state
+        action = self.actions[action_index]
+        action.result_state = result_state
+        self.unexplored_indices.discard(action_index)
+        if action.priority >= 0:
+            self.explored_indices.add(action_index)
+
+    def get_back_action(self) -> Action:
+        # Kept out of self.actions, so it never counts as an unexplored action of the screen
+        if self.back_action is None:
+            self.back_action = Action(
+                desc="KEYCODE_BACK",
+                class_name="",
+                resource_id="",
+                action_type="back",
+                input_type="key",
+                bounds="",
+                result_state=None,
+                priority=0,
+            )
+        return self.back_action
+
+    def can_learn_back(self) -> bool:
+        back_action = self.get_back_action()
+        return back_action.result_state is None and back_action.priority >= 0
+
+    def disable_action(self, action_index: int) -> None:
+        self.actions[action_index].priority = -100
+        self.unexplored_indices.discard(action_index)
+        self.explored_indices.discard(action_index)
 
 
 def is_actionable(elem: Any) -> bool:
@@ -0,0 +1,56 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List
+
+
+class CrawlJournal:
+    """
+    Append-only JSONL log of everything a Crawler learns about an app. Each record is flushed
+    as soon as it is written, so a crawl that dies mid-app loses at most the step in progress.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "a")
+
+    def append(self, record_type: str, **fields: Any) -> None:
+        record = {"type": record_type, **fields}
+        self.file.write(json.dumps(record, sort_keys=True) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_journal(path: str) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.decoder.JSONDecodeError:
+                # Only the last record can be torn, if the process died while writing it
+                logging.warning(f"Skipping truncated journal record in {path}")
+                return
+
+
+def read_graph(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    # The crawl graph, keyed by source uuid, as recorded by the journal's edge records
+    graph: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for record in read_journal(path):
+        if record["type"] == "edge":
+            graph[record["src_uuid"]].append(record["action"])
+    return graph
+
+
+def write_graph(journal_path: str, graph_path: str) -> None:
+    graph = read_graph(journal_path)
+    # Replaced in one step, so a crawl killed while writing keeps the previous graph
+    tmp_path = graph_path + ".tmp"
+    with open(tmp_path, "w") as out:
+        json.dump(graph, out, sort_keys=True, indent=2)
+    os.replace(tmp_path, graph_path)
@@ -4,7 +4,7 @@ import re
 import shutil
 from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Iterator, List, Set, Tuple
+from typing import Dict, Iterator, List, Match, Optional, Set, Tuple
 
 START_PATTERN = r"(?P<ts>[\d :-]+).*Starting crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))?"
 RESTART_PATTERN = r"(?P<ts>[\d :-]+).*Restarting crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))? from checkpoint"
@@ -13,7 +13,9 @@ TIMED_OUT_PATTERN = r"(?P<ts>[\d :-]+).*Crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))?
 COMPLETED_PATTERN = (
     r"(?P<ts>[\d :-]+).*Crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))? completed"
 )
-FORCE_STOP_PATTERN = r"(?P<ts>[\d :-]+).*Crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))? terminated forcefully by user"
+FORCE_STOP_PATTERN = r"(?P<ts>[\d :-]+).*Crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))? (?:terminated forcefully|stopped) by user"
+PLATEAUED_PATTERN = r"(?P<ts>[\d :-]+).*Crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))? plateaued at (?P<rate>[\d.]+) discoveries per minute"
+STALLED_PATTERN = r"(?P<ts>[\d :-]+).*Crawl of (?P<pkg>\S+)(?: v(?P<ver>\S+))? stalled for (?P<seconds>\d+) seconds\. (?P<recovery>Relaunching|Crawl stopped|Rebooting device)"
 MISSING_ACCESS_BUTTON_PATTERN = r"(?P<ts>[\d :-]+).*Accessibility button missing or obstructed for (?P<pkg>\S+)(?: v(?P<ver>\S+))?"
 patterns = [
     START_PATTERN,
@@ -22,6 +24,8 @@ patterns = [
     TIMED_OUT_PATTERN,
     COMPLETED_PATTERN,
     FORCE_STOP_PATTERN,
+    PLATEAUED_PATTERN,
+    STALLED_PATTERN,
     MISSING_ACCESS_BUTTON_PATTERN,
 ]
 LOG_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
@@ -55,6 +59,7 @@ def get_crawled_summary(config: configparser.ConfigParser) -> Dict[str, List[str
         for app in summary["failed"]
         if app not in summary["completed"]
         and app not in summary["timed_out"]
+        and app not in summary["plateaued"]
         and crawl_times.get(app, 0) < TIMED_OUT_THRESHOLD
     ]
 
@@ -67,8 +72,19 @@ def get_crawled_summary(config: configparser.ConfigParser) -> Dict[str, List[str
     return summary
 
 
+def get_crawl_times_from_log(config: configparser.ConfigParser) -> Dict[str, int]:
+    log_file_path = os.path.join(config["crawl"]["output_path"], "crawl.log")
+    if not os.path.exists(log_file_path):
+        return {}
+    split_logs_dir = "split_logs"
+    split_log_by_device(log_file_path, split_logs_dir)
+    crawl_times = get_crawl_times(split_logs_dir)
+    shutil.rmtree(split_logs_dir)
+    return crawl_times
+
+
 def get_apps_status(split_logs_dir: str) -> Dict[str, List[str]]:
-    failed, completed, timed_out = set(), set(), set()
+    failed, completed, timed_out, plateaued = set(), set(), set(), set()
     for device_logfile in os.scandir(split_logs_dir):
         with open(device_logfile.path, "r") as f:
             for line in f:
@@ -93,6 +109,18 @@ def get_apps_status(split_logs_dir: str) -> Dict[str, List[str]]:
                     timed_out.add(match.group("pkg"))
                     continue
 
+                match = re.search(PLATEAUED_PATTERN, line)
+                if match:
+                    plateaued.add(match.group("pkg"))
+                    continue
+
+                # A relaunch continues the same crawl, while a skip or reboot ends it
+                match = re.search(STALLED_PATTERN, line)
+                if match:
+                    if match.group("recovery") != "Relaunching":
+                        failed.add(match.group("pkg"))
+                    continue
+
                 match = re.search(MISSING_ACCESS_BUTTON_PATTERN, line)
                 if match:
                     failed.add(match.group("pkg"))
@@ -100,10 +128,12 @@ def get_apps_status(split_logs_dir: str) -> Dict[str, List[str]]:
     failed.discard("")
     completed.discard("")
     timed_out.discard("")
+    plateaued.discard("")
     return {
         "failed": list(failed),
         "completed": list(completed),
         "timed_out": list(timed_out),
+        "plateaued": list(plateaued),
     }
 
 
@@ -125,6 +155,8 @@ def get_crawl_times(split_logs_dir: str) -> Dict[str, int]:
                         re.search(MISSING_ACCESS_BUTTON_PATTERN, line)
                         or re.search(COMPLETED_PATTERN, line)
                         or re.search(TIMED_OUT_PATTERN, line)
+                        or re.search(PLATEAUED_PATTERN, line)
+                        or get_stall_end_match(line)
                     )
                     if end_match:
                         timestamp, app = end_match.group("ts"), end_match.group("pkg")
@@ -137,6 +169,13 @@ def get_crawl_times(split_logs_dir: str) -> Dict[str, int]:
     return crawl_times
 
 
+def get_stall_end_match(line: str) -> Optional[Match[str]]:
+    match = re.search(STALLED_PATTERN, line)
+    if match and match.group("recovery") != "Relaunching":
+        return match
+    return None
+
+
 def split_log_by_device(log_file_path: str, split_logs_dir: str) -> None:
     if os.path.exists(split_logs_dir):
         shutil.rmtree(split_logs_dir)
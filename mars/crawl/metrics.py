@@ -0,0 +1,190 @@
+import bisect
+import collections
+import contextlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .clock import monotonic
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Counters reported as per-minute rates
+RATE_COUNTERS = ("captures", "new_states", "actions")
+NUM_RECENT_ERRORS = 10
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # One count per bucket, plus one for values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self) -> Dict[str, Any]:
+        # Bucket counts are cumulative, as in Prometheus histograms
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], cumulative)),
+        }
+
+
+class Metrics:
+    """
+    Counters and per-phase latency histograms of the crawl running on one device. Updated
+    from the crawl thread and the crawler's background threads, so every update takes a lock.
+    """
+
+    def __init__(
+        self,
+        device: str,
+        app: str = "",
+        version: str = "",
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.device = device
+        self.app = app
+        self.version = version
+        self.clock = clock
+        self.start_time = clock()
+        self.counters: Dict[str, int] = {}
+        self.phases: Dict[str, Histogram] = {}
+        self.recent_errors: Deque[str] = collections.deque(maxlen=NUM_RECENT_ERRORS)
+        self.lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, phase: str, seconds: float) -> None:
+        with self.lock:
+            if phase not in self.phases:
+                self.phases[phase] = Histogram()
+            self.phases[phase].observe(seconds)
+
+    def record_error(self, message: str) -> None:
+        with self.lock:
+            self.recent_errors.append(message)
+
+    @contextlib.contextmanager
+    def timer(self, phase: str) -> Iterator[None]:
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(phase, self.clock() - start)
+
+    def get_elapsed(self) -> float:
+        return self.clock() - self.start_time
+
+    def get_rate(self, name: str) -> float:
+        # Per minute since the crawl started
+        elapsed = self.get_elapsed()
+        if elapsed <= 0:
+            return 0.0
+        with self.lock:
+            return 60 * self.counters.get(name, 0) / elapsed
+
+    def as_dict(self) -> Dict[str, Any]:
+        rates = {f"{name}_per_minute": self.get_rate(name) for name in RATE_COUNTERS}
+        with self.lock:
+            return {
+                "device": self.device,
+                "app": self.app,
+                "version": self.version,
+                "elapsed": self.get_elapsed(),
+                "counters": dict(self.counters),
+                "rates": rates,
+                "phases": {phase: h.as_dict() for phase, h in self.phases.items()},
+                "recent_errors": list(self.recent_errors),
+            }
+
+    def save(self, path: str) -> None:
+        # Written to a temporary file first, so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+# The metrics of the crawl currently running on each device in this process
+_metrics: Dict[str, Metrics] = {}
+_metrics_lock = threading.Lock()
+
+
+def get_metrics(device: str) -> Metrics:
+    with _metrics_lock:
+        if device not in _metrics:
+            _metrics[device] = Metrics(device)
+        return _metrics[device]
+
+
+def start_crawl_metrics(device: str, app: str, version: str) -> Metrics:
+    with _metrics_lock:
+        _metrics[device] = Metrics(device, app, version)
+        return _metrics[device]
+
+
+class ErrorLogHandler(logging.Handler):
+    """
+    Adds warnings and errors logged for a device, i.e. messages starting with "[device]", to
+    the recent errors of that device's metrics.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(level=logging.WARNING)
+        self.setFormatter(logging.Formatter("%(asctime)s: %(message)s"))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        match = re.match(r"\[(\S+)\]", record.getMessage())
+        if match:
+            get_metrics(match.group(1)).record_error(self.format(record))
+
+
+def get_metrics_path(output_path: str, device: str) -> str:
+    return os.path.join(output_path, "metrics", f"{device}.json")
+
+
+def read_metrics(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, json.decoder.JSONDecodeError):
+        return None
+
+
+def describe(metrics: Dict[str, Any], num_phases: int = 3) -> str:
+    rates = metrics["rates"]
+    counters = metrics["counters"]
+    # The phases that took the most time in total are where optimisations pay off
+    phases: List[Tuple[str, Dict[str, Any]]] = sorted(
+        metrics["phases"].items(), key=lambda item: item[1]["sum"], reverse=True
+    )
+    top_phases = ", ".join(
+        f"{phase} {h['sum']:.0f}s ({h['count']} x {h['mean']:.2f}s)"
+        for phase, h in phases[:num_phases]
+    )
+    return (
+        f"{rates['captures_per_minute']:.1f} captures/min, "
+        f"{rates['new_states_per_minute']:.1f} new states/min, "
+        f"{max(0, counters.get('launches', 0) - 1)} relaunches | {top_phases}"
+    )
@@ -0,0 +1,149 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import crawl.adb_session as adb_session
+
+PM_PATH_MARKER = "__MARS_PM_PATH__"
+
+
+@dataclass
+class PackageInfo:
+    app: str
+    version_code: str = ""
+    version_name: str = ""
+    requested_permissions: List[str] = field(default_factory=list)
+    granted_permissions: List[str] = field(default_factory=list)
+    apk_paths: List[str] = field(default_factory=list)
+
+
+# Keyed by (device, app). Entries are dropped whenever the app is installed, uninstalled or
+# has its permissions changed through adb_utils, and when a crawl of the app starts.
+_package_infos: Dict[Tuple[str, str], PackageInfo] = {}
+_package_infos_lock = threading.Lock()
+
+
+def get_package_info(device: str, app: str) -> PackageInfo:
+    key = (device, app)
+    with _package_infos_lock:
+        package_info = _package_infos.get(key)
+    if package_info is None:
+        package_info = fetch_package_info(device, app)
+        with _package_infos_lock:
+            _package_infos[key] = package_info
+    return package_info
+
+
+def invalidate(device: str, app: Optional[str] = None) -> None:
+    with _package_infos_lock:
+        for key in list(_package_infos.keys()):
+            if key[0] == device and (app is None or key[1] == app):
+                del _package_infos[key]
+
+
+def fetch_package_info(device: str, app: str) -> PackageInfo:
+    # dumpsys and pm path in a single round trip, separated by a marker line
+    stdout = adb_session.shell(
+        device, f"dumpsys package {app}; echo {PM_PATH_MARKER}; pm path {app}"
+    )
+    dumpsys, _, pm_path = stdout.partition(PM_PATH_MARKER)
+    return parse_package_info(app, dumpsys, pm_path)
+
+
+def parse_package_info(app: str, dumpsys: str, pm_path: str) -> PackageInfo:
+    lines = [line.strip() for line in dumpsys.split("\n")]
+    package_info = PackageInfo(app=app)
+
+    version_names = [line for line in lines if "versionName" in line]
+    if version_names:
+        version = version_names[0].split("=")[1]
+        version = version.replace(" ", "")
+        version = version.replace("version", "")
+        version = version.replace("/", ".")
+        package_info.version_name = re.sub(r"\([^)]*\)", "", version)
+
+    # One versionCode line per installed copy of the package (e.g. system image + update)
+    version_codes = [line for line in lines if "versionCode" in line and "=" in line]
+    vcodes = [line.split(" ")[0].split("=")[1] for line in version_codes]
+    if vcodes:
+        package_info.version_code = sorted(vcodes, reverse=True)[0]
+
+    permission_lines = [line for line in lines if "permission" in line]
+    try:
+        start = permission_lines.index("requested permissions:")
+        end = permission_lines.index("install permissions:")
+        package_info.requested_permissions = [
+            p.split(":")[0] for p in permission_lines[start + 1 : end]
+        ]
+    except ValueError:
+        pass
+
+    granted = [line.split(":")[0] for line in lines if "granted=true" in line]
+    package_info.granted_permissions = list(dict.fromkeys(granted))
+
+    for line in pm_path.split("\n"):
+        match = re.search(r"package:(\S*)", line)
+        if match:
+            package_info.apk_paths.append(match.group(1))
+    return package_info
+
+
+def parse_package_list(stdout: str) -> Dict[str, str]:
+    packages = {}
+    for line in stdout.split("\n"):
+        match = re.match(r"package:(\S+)(?: versionCode:(\d+))?", line.strip())
+        if match:
+            packages[match.group(1)] = match.group(2) or ""
+    return packages
+
+
+def list_installed_packages(device: str) -> Dict[str, str]:
+    # Maps every installed package to its version code, from a single pm call. Older pm
+    # versions reject --show-versioncode, so those devices are listed without version codes.
+    stdout, returncode = adb_session.shell_with_status(
+        device, "pm list packages --show-versioncode"
+    )
+    packages = parse_package_list(stdout) if returncode == 0 else {}
+    if not packages:
+        packages = parse_package_list(adb_session.shell(device, "pm list packages"))
+    return packages
+
+
+class PackageIndex:
+    """
+    Installed packages and their version codes for a set of devices. Each device is read with
+    a single `pm list packages` call, all devices concurrently, and the result is kept until
+    the device is invalidated.
+    """
+
+    def __init__(self, devices: List[str]) -> None:
+        self.devices = devices
+        self.packages: Dict[str, Dict[str, str]] = {}
+        self.refresh(devices)
+
+    def refresh(self, devices: List[str]) -> None:
+        if not devices:
+            return
+        with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+            results = executor.map(list_installed_packages, devices)
+            for device, packages in zip(devices, results):
+                self.packages[device] = packages
+
+    def invalidate(self, device: str) -> None:
+        self.packages.pop(device, None)
+
+    def get_packages(self, device: str) -> Dict[str, str]:
+        if device not in self.packages:
+            self.refresh([device])
+        return self.packages[device]
+
+    def is_installed(self, device: str, app: str) -> bool:
+        return app in self.get_packages(device)
+
+    def get_version_code(self, device: str, app: str) -> Optional[str]:
+        return self.get_packages(device).get(app)
+
+    def get_devices_with_app(self, app: str) -> List[str]:
+        return [device for device in self.devices if self.is_installed(device, app)]
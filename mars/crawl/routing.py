@@ -0,0 +1,110 @@
+import heapq
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .graph_objects import Action, State
+
+# Fastest known action between two states, with its latency in seconds
+Edge = Tuple[float, Action]
+
+
+class RoutingTree:
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.dist: Dict[str, float] = {source: 0.0}
+        self.parent: Dict[str, Tuple[str, Action]] = {}
+
+
+class Router:
+    """
+    Shortest-path planner over the crawl graph. Edges are weighted by the measured latency of
+    their action, and shortest-path trees are cached for the launch state and for the most
+    recently used start states. Cached trees are updated in place as edges are added.
+    """
+
+    def __init__(self, default_latency: float, max_trees: int = 8) -> None:
+        self.default_latency = default_latency
+        self.max_trees = max_trees
+        self.adjacency: Dict[str, Dict[str, Edge]] = defaultdict(dict)
+        self.trees: "OrderedDict[str, RoutingTree]" = OrderedDict()
+        self.root: Optional[str] = None
+
+    def get_weight(self, action: Action) -> float:
+        return action.latency if action.latency is not None else self.default_latency
+
+    def set_root(self, state: State) -> None:
+        self.root = state.state_id
+
+    def add_edge(self, src: State, action: Action, dst: State) -> None:
+        u, v = src.state_id, dst.state_id
+        if u == v:
+            return
+        weight = self.get_weight(action)
+        prev = self.adjacency[u].get(v)
+        if prev is not None:
+            prev_weight, prev_action = prev
+            if prev_action is not action and prev_weight <= weight:
+                return
+            if weight > prev_weight:
+                # Distances can only be patched in place when they shrink
+                self.drop_trees_using(u, v)
+        self.adjacency[u][v] = (weight, action)
+        for tree in self.trees.values():
+            self.relax(tree, u, v, weight, action)
+
+    def drop_trees_using(self, u: str, v: str) -> None:
+        for source in list(self.trees.keys()):
+            parent = self.trees[source].parent.get(v)
+            if parent is not None and parent[0] == u:
+                del self.trees[source]
+
+    def relax(self, tree: RoutingTree, u: str, v: str, weight: float, action: Action) -> None:
+        if u not in tree.dist:
+            return
+        dist_v = tree.dist[u] + weight
+        if dist_v >= tree.dist.get(v, float("inf")):
+            return
+        tree.dist[v] = dist_v
+        tree.parent[v] = (u, action)
+        self.propagate(tree, [(dist_v, v)])
+
+    def propagate(self, tree: RoutingTree, queue: List[Tuple[float, str]]) -> None:
+        while queue:
+            dist_x, x = heapq.heappop(queue)
+            if dist_x > tree.dist[x]:
+                continue
+            for y, (weight, action) in self.adjacency[x].items():
+                dist_y = dist_x + weight
+                if dist_y < tree.dist.get(y, float("inf")):
+                    tree.dist[y] = dist_y
+                    tree.parent[y] = (x, action)
+                    heapq.heappush(queue, (dist_y, y))
+
+    def get_tree(self, source: str) -> RoutingTree:
+        tree = self.trees.get(source)
+        if tree is not None:
+            self.trees.move_to_end(source)
+            return tree
+
+        tree = RoutingTree(source)
+        self.propagate(tree, [(0.0, source)])
+        self.trees[source] = tree
+        while len(self.trees) > self.max_trees:
+            oldest = next(s for s in self.trees if s != self.root)
+            del self.trees[oldest]
+        return tree
+
+    def get_distance(self, start: State, goal: State) -> Optional[float]:
+        return self.get_tree(start.state_id).dist.get(goal.state_id)
+
+    def find_path(self, start: State, goal: State) -> List[Action]:
+        tree = self.get_tree(start.state_id)
+        if goal.state_id not in tree.parent:
+            return []
+        actions = []
+        node = goal.state_id
+        while node != tree.source:
+            node, action = tree.parent[node]
+            actions.append(action)
+        actions.reverse()
+        return actions
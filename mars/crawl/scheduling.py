@@ -0,0 +1,96 @@
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Type
+
+from .graph_objects import State
+
+if TYPE_CHECKING:
+    from .crawler import Crawler
+
+
+class Scheduler:
+    """
+    Base class for policies that pick which state the crawler should explore next.
+    get_next_states() must be overriden in all Scheduler derived classes.
+    """
+
+    name = ""
+
+    def get_next_states(self, crawler: "Crawler", cur_state: State) -> Iterable[State]:
+        raise NotImplementedError()
+
+
+class PriorityScheduler(Scheduler):
+    """
+    Prefers children of the current state, then falls back to every state with unexplored
+    actions. Candidates are ordered by their static priority only.
+    """
+
+    name = "priority"
+
+    def get_next_states(self, crawler: "Crawler", cur_state: State) -> Iterable[State]:
+        states = []
+
+        # First, try to get next state that can be reached from the current state AND has an action
+        for state in cur_state.get_children():
+            if state.state_id not in crawler.out_states:
+                if state.has_next_action():
+                    states.append(state)
+
+        # Second, get any state has an action. States all share the same priority, so these
+        # are already in order.
+        if not states:
+            return crawler.get_frontier_states()
+
+        return sorted(states, key=lambda s: s.priority, reverse=True)
+
+
+class CostAwareScheduler(Scheduler):
+    """
+    Orders every state with unexplored actions by the number of unexplored actions it offers
+    per second of estimated travel time. Travel time is the replay path latency from the
+    current state, or a relaunch followed by the replay path from the launch state. States
+    with no known route are kept last, since a relaunch may still reach them.
+    """
+
+    name = "cost"
+
+    def get_next_states(self, crawler: "Crawler", cur_state: State) -> Iterable[State]:
+        scores = {}
+        for state in crawler.get_frontier_states():
+            travel_time = self.estimate_travel_time(crawler, cur_state, state)
+            if travel_time is None:
+                scores[state.state_id] = -1.0
+                continue
+            expected_actions = len(state.unexplored_indices)
+            scores[state.state_id] = expected_actions / (travel_time + crawler.get_mean_latency())
+
+        states = [crawler.vertices[state_id] for state_id in scores]
+        return sorted(states, key=lambda s: scores[s.state_id], reverse=True)
+
+    def estimate_travel_time(
+        self, crawler: "Crawler", cur_state: State, state: State
+    ) -> Optional[float]:
+        if state == cur_state:
+            return 0.0
+        distance = crawler.router.get_distance(cur_state, state)
+        if distance is not None:
+            return distance
+
+        root = crawler.vertices.get(crawler.router.root) if crawler.router.root else None
+        if root is None:
+            return None
+        distance = 0.0 if root == state else crawler.router.get_distance(root, state)
+        if distance is None:
+            return None
+        return crawler.get_launch_latency() + distance
+
+
+SCHEDULERS: Dict[str, Type[Scheduler]] = {
+    PriorityScheduler.name: PriorityScheduler,
+    CostAwareScheduler.name: CostAwareScheduler,
+}
+
+
+def get_scheduler(name: str) -> Scheduler:
+    if name not in SCHEDULERS:
+        raise Exception(f"Invalid scheduler: {name}")
+    return SCHEDULERS[name]()
@@ -0,0 +1,319 @@
+import configparser
+import json
+import os
+import shlex
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import crawl.utils as utils
+
+from .adb_session import DeviceBackend
+from .adb_utils import ONDEVICE_VIEW_PATH
+from .clock import SimulatedClock
+
+LAUNCHER_PACKAGE = "com.android.launcher3"
+# Screens that are not part of the recording
+HOME_SCREEN = "__home__"
+OUTSIDE_SCREEN = "__outside__"
+
+
+@dataclass
+class SimulatedAction:
+    input_type: str
+    desc: str
+    bounds: Tuple[int, int, int, int]
+    result_uuid: Optional[str]
+
+    def contains(self, x: int, y: int) -> bool:
+        left, top, right, bottom = self.bounds
+        return left <= x <= right and top <= y <= bottom
+
+    def get_area(self) -> int:
+        left, top, right, bottom = self.bounds
+        return (right - left) * (bottom - top)
+
+
+class CrawlRecording:
+    """
+    A previous crawl of one app, as written to the views, screenshots and graphs directories:
+    the screens it captured, and where each explored action on a screen led.
+    """
+
+    def __init__(self, app: str, views_dir: str, screenshots_dir: str, graph_path: str) -> None:
+        self.app = app
+        self.views_dir = views_dir
+        self.screenshots_dir = screenshots_dir
+        with open(graph_path, "r") as f:
+            graph = json.load(f)
+
+        self.actions: Dict[str, List[SimulatedAction]] = {}
+        for src_uuid, action_dicts in graph.items():
+            self.actions[src_uuid] = [
+                SimulatedAction(
+                    input_type=a["input_type"],
+                    desc=a["desc"],
+                    bounds=self.parse_bounds(a["bounds"]),
+                    result_uuid=a.get("result_uuid"),
+                )
+                for a in action_dicts
+            ]
+        # Screens recorded inside the app. Results without a view were outside the app.
+        self.screens = [
+            uuid for uuid in self.get_graph_uuids() if os.path.exists(self.get_view_path(uuid))
+        ]
+        self.screen_set = set(self.screens)
+        self.start_uuid = self.find_start_uuid()
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser, app: str) -> "CrawlRecording":
+        return cls(
+            app,
+            os.path.join(config["crawl"]["views_path"], app),
+            os.path.join(config["crawl"]["screenshots_path"], app),
+            os.path.join(config["crawl"]["graphs_path"], app, "graph.json"),
+        )
+
+    @staticmethod
+    def parse_bounds(bounds: str) -> Tuple[int, int, int, int]:
+        search = utils.BOUNDS_PATTERN.search(bounds)
+        if not search:
+            return (0, 0, 0, 0)
+        left, top, right, bottom = (int(v) for v in search.groups())
+        return (left, top, right, bottom)
+
+    def get_graph_uuids(self) -> List[str]:
+        uuids = dict.fromkeys(self.actions.keys())
+        for actions in self.actions.values():
+            uuids.update(dict.fromkeys(a.result_uuid for a in actions if a.result_uuid))
+        return list(uuids)
+
+    def find_start_uuid(self) -> str:
+        # The launch screen is never the result of an action in the app, unless every screen
+        # is. Among candidates, the first view written is the one captured at launch.
+        results = {a.result_uuid for actions in self.actions.values() for a in actions}
+        candidates = [uuid for uuid in self.screens if uuid not in results] or self.screens
+        if not candidates:
+            raise ValueError(f"Recorded crawl of {self.app} has no screens")
+        return min(candidates, key=lambda uuid: os.path.getmtime(self.get_view_path(uuid)))
+
+    def is_screen(self, uuid: str) -> bool:
+        return uuid in self.screen_set
+
+    def get_view_path(self, uuid: str) -> str:
+        return os.path.join(self.views_dir, uuid) + ".json"
+
+    def get_view(self, uuid: str) -> bytes:
+        with open(self.get_view_path(uuid), "rb") as f:
+            return f.read()
+
+    def get_screenshot(self, uuid: str) -> bytes:
+        path = os.path.join(self.screenshots_dir, uuid) + ".png"
+        if not os.path.exists(path):
+            return b""
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def get_outside_view(screen: str) -> bytes:
+    # A screen of another package, e.g. the launcher or a browser opened by the app
+    root = {
+        "className": "android.widget.FrameLayout",
+        "resourceId": f"{LAUNCHER_PACKAGE}:id/{screen.strip('_')}",
+        "bounds": "[0,0][1080,1920]",
+        "screenWidth": 1080,
+        "screenHeight": 1920,
+        "contentDesc": "",
+        "text": "",
+        "hintText": "",
+        "packageName": LAUNCHER_PACKAGE,
+        "isClickable": False,
+        "isFocusable": False,
+        "isVisibleToUser": True,
+        "isImportantForAccessibility": True,
+        "isFocused": False,
+        "isSelected": False,
+        "isChecked": False,
+        "children": [],
+    }
+    return json.dumps(root).encode("utf-8")
+
+
+class SimulatedDevice(DeviceBackend):
+    """
+    Replays a recorded crawl as a deterministic device. Taps are resolved by bounds to the
+    recorded result of the smallest matching action on the current screen, and unrecorded
+    actions leave the screen unchanged. Every command costs simulated time, and a transition
+    only shows its new screen after `action_latency` (or `launch_latency`) seconds, so
+    captures taken too early still see the old screen. Recorded action latencies are not
+    used, since they include the recording crawler's own waits.
+    """
+
+    def __init__(
+        self,
+        recording: CrawlRecording,
+        clock: SimulatedClock,
+        version_code: str = "1",
+        action_latency: float = 1.0,
+        launch_latency: float = 3.0,
+        command_latency: float = 0.05,
+        capture_latency: float = 0.5,
+        screenshot_latency: float = 0.3,
+    ) -> None:
+        self.recording = recording
+        self.clock = clock
+        self.version_code = version_code
+        self.action_latency = action_latency
+        self.launch_latency = launch_latency
+        self.command_latency = command_latency
+        self.capture_latency = capture_latency
+        self.screenshot_latency = screenshot_latency
+
+        self.screen = HOME_SCREEN
+        self.history: List[str] = []
+        self.pending: Optional[Tuple[str, float]] = None
+        # Simulated time at which each recorded screen was first captured
+        self.captured: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def get_screen(self) -> str:
+        if self.pending and self.clock.monotonic() >= self.pending[1]:
+            self.screen = self.pending[0]
+            self.pending = None
+        return self.screen
+
+    def transition(self, screen: str, latency: float, push: bool = True) -> None:
+        current = self.get_screen()
+        if push and current != screen:
+            self.history.append(current)
+        self.pending = (screen, self.clock.monotonic() + latency)
+
+    def get_result_screen(self, action: SimulatedAction) -> Optional[str]:
+        if action.result_uuid is None:
+            return None
+        if self.recording.is_screen(action.result_uuid):
+            return action.result_uuid
+        return OUTSIDE_SCREEN
+
+    def execute(self, action: Optional[SimulatedAction]) -> None:
+        if action is None:
+            return
+        screen = self.get_result_screen(action)
+        if screen is not None:
+            self.transition(screen, self.action_latency)
+
+    def get_actions(self) -> List[SimulatedAction]:
+        return self.recording.actions.get(self.get_screen(), [])
+
+    def tap(self, x: int, y: int) -> None:
+        if (x, y) == self.access_button:
+            return
+        hits = [a for a in self.get_actions() if a.input_type == "touch" and a.contains(x, y)]
+        self.execute(min(hits, key=lambda a: a.get_area()) if hits else None)
+
+    def enter_text(self) -> None:
+        texts = [a for a in self.get_actions() if a.input_type == "text" and a.result_uuid]
+        self.execute(texts[0] if texts else None)
+
+    def press_key(self, keycode: str) -> None:
+        if keycode in ("KEYCODE_BACK", "4"):
+            self.get_screen()
+            previous = self.history.pop() if self.history else HOME_SCREEN
+            self.transition(previous, self.action_latency, push=False)
+        elif keycode in ("KEYCODE_HOME", "3"):
+            self.history = []
+            self.transition(HOME_SCREEN, self.action_latency, push=False)
+        else:
+            keys = [a for a in self.get_actions() if a.input_type == "key" and a.desc == keycode]
+            self.execute(keys[0] if keys else None)
+
+    def launch(self) -> None:
+        self.get_screen()
+        self.history = []
+        self.transition(self.recording.start_uuid, self.launch_latency, push=False)
+
+    def get_package_dump(self) -> str:
+        return (
+            f"Packages:\n"
+            f"  Package [{self.recording.app}]:\n"
+            f"    versionCode={self.version_code} minSdk=21 targetSdk=29\n"
+            f"    versionName={self.version_code}\n"
+            f"    requested permissions:\n"
+            f"    install permissions:\n"
+        )
+
+    def get_focus(self) -> str:
+        # Null while a transition is in progress, like a real window change
+        screen = self.get_screen()
+        if self.pending:
+            return "mCurrentFocus=null"
+        package = self.recording.app if self.recording.is_screen(screen) else LAUNCHER_PACKAGE
+        return f"mCurrentFocus=Window{{sim {package}/{screen}}}"
+
+    def run_command(self, command: str) -> Tuple[str, int]:
+        self.clock.advance(self.command_latency)
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            return "", 1
+        if not args:
+            return "", 0
+
+        program = args[0]
+        if program == "sleep":
+            self.clock.advance(float(args[1]))
+        elif program == "input" and len(args) >= 4 and args[1] == "tap":
+            self.tap(int(args[2]), int(args[3]))
+        elif program == "input" and len(args) >= 3 and args[1] == "text":
+            self.enter_text()
+        elif program == "input" and len(args) >= 3 and args[1] == "keyevent":
+            for keycode in args[2:]:
+                if not keycode.startswith("--"):
+                    self.press_key(keycode)
+        elif program == "monkey" and self.recording.app in args:
+            self.launch()
+        elif program == "am" and args[1:2] == ["force-stop"]:
+            if args[2:3] == [self.recording.app]:
+                self.history = []
+                self.transition(HOME_SCREEN, 0.0, push=False)
+        elif program == "dumpsys" and args[1:2] == ["package"]:
+            return self.get_package_dump(), 0
+        elif program == "dumpsys" and args[1:2] == ["window"]:
+            return self.get_focus(), 0
+        elif program == "dumpsys" and args[1:2] == ["nfc"]:
+            return "mScreenState=ON_UNLOCKED", 0
+        elif program == "pm" and args[1:2] == ["path"]:
+            return f"package:/data/app/{self.recording.app}/base.apk", 0
+        elif program == "getprop" and args[1:2] == ["sys.boot_completed"]:
+            return "1", 0
+        elif program == "echo":
+            return " ".join(args[1:]), 0
+        return "", 0
+
+    def run(self, command: str) -> Tuple[str, int]:
+        # Shell scripts, such as replayed paths, are run one command at a time
+        with self.lock:
+            outputs = []
+            returncode = 0
+            for part in command.split(";"):
+                output, returncode = self.run_command(part.strip())
+                if output:
+                    outputs.append(output)
+            return "\n".join(outputs), returncode
+
+    def exec_out(self, command: str) -> bytes:
+        with self.lock:
+            screen = self.get_screen()
+            if command.startswith("screencap"):
+                self.clock.advance(self.screenshot_latency)
+                if not self.recording.is_screen(screen):
+                    return b""
+                return self.recording.get_screenshot(screen)
+            if ONDEVICE_VIEW_PATH in command:
+                self.clock.advance(self.capture_latency)
+                if not self.recording.is_screen(screen):
+                    return get_outside_view(screen)
+                self.captured.setdefault(screen, self.clock.monotonic())
+                return self.recording.get_view(screen)
+        output, _ = self.run(command)
+        return output.encode("utf-8")
@@ -0,0 +1,45 @@
+import statistics
+from typing import Any, Dict, List, MutableSequence, Optional, Tuple
+
+# An app waiting to be crawled, and the devices it is installed on
+Task = Tuple[str, List[str]]
+
+
+class TaskBoard:
+    """
+    Apps waiting to be crawled, shared by every worker. An idle worker claims the first app
+    on the board that is installed on its device, so no device waits on a backlog assigned
+    to another. `tasks` and `lock` must be shareable between the workers, e.g. a manager list
+    and a multiprocessing lock for process workers.
+    """
+
+    def __init__(self, tasks: MutableSequence[Task], lock: Any) -> None:
+        self.tasks = tasks
+        self.lock = lock
+
+    def claim(self, device: str) -> Optional[str]:
+        with self.lock:
+            # One copy up front, since indexing a manager list is a round trip per item
+            for i, (app, devices) in enumerate(self.tasks[:]):
+                if device in devices:
+                    del self.tasks[i]
+                    return app
+        return None
+
+    def get_num_claimable(self, device: str) -> int:
+        with self.lock:
+            return sum(1 for _, devices in self.tasks[:] if device in devices)
+
+
+def order_longest_first(tasks: List[Task], crawl_times: Dict[str, int], cap: int) -> List[Task]:
+    # Longest-processing-time-first keeps the last apps of the crawl short, which bounds how
+    # long the other devices sit idle at the end. Apps without history are assumed to take
+    # the median of the known crawl times.
+    known_times = [min(t, cap) for app, t in crawl_times.items() if t > 0]
+    default_time = statistics.median(known_times) if known_times else cap
+
+    def expected_time(task: Task) -> float:
+        app = task[0]
+        return min(crawl_times[app], cap) if crawl_times.get(app, 0) > 0 else default_time
+
+    return sorted(tasks, key=expected_time, reverse=True)
@@ -0,0 +1,203 @@
+import configparser
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import crawl.adb_utils as adb_utils
+import crawl.clock as clock
+import crawl.utils as utils
+
+from .crawl_controller import CrawlController, run_crawl
+from .crawler import Crawler
+from .task_board import TaskBoard
+from .watchdog import Watchdog
+
+# Seconds stop commands wait for a crawl step to finish before returning
+STOP_TIMEOUT = 30
+
+
+def send_keycode_event(device: str, keycode: str) -> None:
+    # Control commands use their own adb process, so they never wait behind a crawl
+    # step that is holding the device's shell session
+    subprocess.call(
+        ["adb", "-s", device, "shell", f"input keyevent {keycode}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+class ThreadedCrawlWorker:
+    """
+    Crawls the apps it claims for one device on a thread of the controller's process. Each
+    crawl is stopped cooperatively through its stop_event instead of being killed, so it only
+    stops once its current step finishes. Until then, the worker's status is "stopping".
+    """
+
+    def __init__(
+        self,
+        config: configparser.ConfigParser,
+        device: str,
+        task_board: TaskBoard,
+        reset: bool,
+    ) -> None:
+        self.config = config
+        self.device = device
+        self.task_board = task_board
+        self.reset = reset
+
+        self.app = ""
+        self.version = ""
+        self.status = "not started"
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        # Whether to claim the next app once the current crawl has stopped, for skip
+        self.restart = False
+        self.watchdog = Watchdog(config, device)
+        self.watchdog.start()
+
+        self.full_crawl_timeout = float(self.config["crawl"]["full_crawl_timeout"])
+
+        adb_utils.sync_accesspull_service(config, device)
+        adb_utils.enable_accesspull_service(device)
+
+    def get_status(self) -> str:
+        return self.status
+
+    def get_app(self) -> str:
+        return self.app
+
+    def get_version(self) -> str:
+        return self.version
+
+    def get_pid(self) -> int:
+        return os.getpid()
+
+    def get_num_queued(self) -> int:
+        return self.task_board.get_num_claimable(self.device)
+
+    def unlock(self) -> None:
+        adb_utils.unlock_device(self.device)
+
+    def reboot(self) -> None:
+        adb_utils.reboot_device(self.device)
+
+    def wait_for_boot(self) -> None:
+        if not adb_utils.wait_for_boot(self.device):
+            print(f"{self.device} did not finish booting.")
+
+    def mute(self) -> None:
+        send_keycode_event(self.device, "164")
+
+    def start(self) -> None:
+        if self.thread is not None and self.thread.is_alive():
+            if self.status == "stopping":
+                print(f"{self.device} is still finishing its current crawl step.")
+            else:
+                print(f"{self.device} is already crawling.")
+            return
+        self.status = "crawling"
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.crawl_apps, daemon=True)
+        self.thread.start()
+
+    def request_stop(self, restart: bool) -> None:
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.restart = restart
+        self.status = "stopping"
+        self.stop_event.set()
+
+    def stop(self) -> None:
+        self.request_stop(restart=False)
+
+    def skip(self) -> None:
+        self.request_stop(restart=True)
+
+    def wait_for_stop(self) -> None:
+        if self.thread is None:
+            return
+        self.thread.join(STOP_TIMEOUT)
+        if self.thread.is_alive() and self.status == "stopping":
+            print(
+                f"{self.device} is still finishing its current crawl step, and shows as "
+                f"stopping until it does."
+            )
+
+    def crawl_apps(self) -> None:
+        while True:
+            app = self.task_board.claim(self.device)
+            if app is None:
+                send_keycode_event(self.device, "KEYCODE_HOME")
+                logging.info(f"All apps crawled on {self.device}")
+                self.status = "finished"
+                self.app = ""
+                self.version = ""
+                return
+
+            try:
+                self.crawl_app(app)
+            except Exception:
+                # Would otherwise only be printed by the thread's default exception hook
+                logging.exception(f"[{self.device}] Crawl of {app} failed unexpectedly")
+
+            if self.stop_event.is_set():
+                send_keycode_event(self.device, "KEYCODE_HOME")
+                logging.error(
+                    f"[{self.device}] Crawl of {self.app} v{self.version} "
+                    f"stopped by user after its current step. Crawl stopped."
+                )
+                self.app = ""
+                self.version = ""
+                if not self.restart:
+                    self.status = "not started"
+                    return
+                self.stop_event.clear()
+                self.status = "crawling"
+
+    def crawl_app(self, app: str) -> None:
+        if self.reset:
+            utils.reset_data_for_app(self.config, app)
+
+        # SIGALRM only reaches the main thread, so the timeout is enforced by the crawler
+        deadline = clock.monotonic() + self.full_crawl_timeout
+
+        def on_crawler_created(crawl_instance: Crawler) -> None:
+            crawl_instance.stop_event = self.stop_event
+            crawl_instance.deadline = deadline
+            self.app = crawl_instance.app
+            self.version = crawl_instance.version
+            self.watchdog.watch(crawl_instance)
+
+        try:
+            run_crawl(self.config, self.device, app, on_crawler_created)
+        finally:
+            self.watchdog.watch(None)
+
+
+class ThreadedCrawlController(CrawlController):
+    """
+    Crawls every connected device from a thread of this process, instead of one process per
+    device. Device I/O blocks only the thread of its device.
+    """
+
+    def get_workers(self) -> List[ThreadedCrawlWorker]:
+        # Every worker runs in this process, so a plain list and lock are enough
+        task_board = TaskBoard(self.get_tasks(), threading.Lock())
+        with ThreadPoolExecutor(max_workers=max(1, len(self.devices))) as executor:
+            workers = list(
+                executor.map(
+                    lambda device: ThreadedCrawlWorker(
+                        self.config, device, task_board, self.args.reset
+                    ),
+                    self.devices,
+                )
+            )
+        return workers
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        for worker in self.workers:
+            worker.watchdog.stop()
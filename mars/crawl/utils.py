@@ -4,6 +4,9 @@ import re
 import shutil
 from typing import Any, Dict, Iterator, Optional, Tuple
 
+TOUCH_BOUNDS_PATTERN = re.compile(r"\[(\d+),(\d+)\]\[(\d+),(\d+)\]")
+BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
 
 def reset_data_for_app(config: configparser.ConfigParser, app: str) -> None:
     for root, dirs, _ in os.walk(config["crawl"]["output_path"]):
@@ -11,9 +14,9 @@ def reset_data_for_app(config: configparser.ConfigParser, app: str) -> None:
             if d == app:
                 app_path = os.path.join(root, d)
                 shutil.rmtree(app_path)
-    crawler_checkpoint = os.path.join(config["crawl"]["crawlers_path"], app) + ".pkl"
-    if os.path.exists(crawler_checkpoint):
-        os.remove(crawler_checkpoint)
+    crawler_journal = os.path.join(config["crawl"]["crawlers_path"], app) + ".jsonl"
+    if os.path.exists(crawler_journal):
+        os.remove(crawler_journal)
 
 
 def bfs(elem: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
@@ -51,7 +54,7 @@ def node_satisifies_props(node: Dict[str, Any], props: Dict[str, Any]) -> bool:
 
 
 def get_touch_from_bounds(bounds: str) -> Tuple[int, int]:
-    search = re.search(r"\[(\d+),(\d+)\]\[(\d+),(\d+)\]", bounds)
+    search = TOUCH_BOUNDS_PATTERN.search(bounds)
     if search:
         x1, x2 = int(search.group(1)), int(search.group(3))
         y1, y2 = int(search.group(2)), int(search.group(4))
@@ -61,7 +64,7 @@ def get_touch_from_bounds(bounds: str) -> Tuple[int, int]:
 
 
 def is_valid_bounds(bounds: str) -> bool:
-    search = re.search(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]", bounds)
+    search = BOUNDS_PATTERN.search(bounds)
     if search:
         x1, x2 = int(search.group(1)), int(search.group(3))
         y1, y2 = int(search.group(2)), int(search.group(4))
@@ -0,0 +1,152 @@
+import json
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .graph_objects import Action, State
+from .journal import read_journal
+from .xiaoyi_heuristics import get_xiaoyi_state_id
+
+PRODUCTIVE = "productive"
+DEAD = "dead"
+OUT_OF_APP = "out"
+# Above every word-based action priority, so known-productive actions are taken first
+WARM_START_PRIORITY = 20
+
+ActionKey = Tuple[str, str, str]
+
+
+def get_action_key(input_type: str, desc: str, bounds: str) -> ActionKey:
+    # Actions whose bounds moved in the new version count as new actions
+    return (input_type, desc, bounds)
+
+
+class CrawlPrior:
+    """
+    What a previous crawl of an app learned about its screens, read from its views, graph.json
+    and journal: where each explored action led (another screen of the app, the same screen,
+    or outside the app), and which actions each explored screen offered. graph.json only holds
+    results inside the app, so the actions that left it are read from the journal, along with
+    the actions the crawl skipped for what its own warm start knew about them.
+    """
+
+    def __init__(self, app: str, views_dir: str, graph_path: str, journal_path: str) -> None:
+        self.app = app
+        self.views_dir = views_dir
+        self.outcomes: Dict[str, Dict[ActionKey, str]] = defaultdict(dict)
+        self.known_actions: Dict[str, Set[ActionKey]] = defaultdict(set)
+        self.explored_actions: Dict[str, Set[ActionKey]] = defaultdict(set)
+        with open(graph_path, "r") as f:
+            graph = json.load(f)
+
+        for src_uuid, action_dicts in graph.items():
+            view_file = self.get_view_path(src_uuid)
+            if not os.path.exists(view_file):
+                continue
+            state_id = get_xiaoyi_state_id(view_file)
+            if not state_id:
+                continue
+            prior_state = State(treefile=view_file, state_id=state_id)
+            self.known_actions[state_id].update(self.get_key(a) for a in prior_state.actions)
+            outcomes = self.outcomes[state_id]
+            for a in action_dicts:
+                outcome = self.get_outcome(state_id, a)
+                key = get_action_key(a["input_type"], a["desc"], a["bounds"])
+                self.explored_actions[state_id].add(key)
+                # The same screen may have been captured more than once
+                if outcome and outcomes.get(key) != PRODUCTIVE:
+                    outcomes[key] = outcome
+        self.load_journal_outcomes(journal_path)
+
+    @classmethod
+    def from_output_path(cls, output_path: str, app: str) -> Optional["CrawlPrior"]:
+        graph_path = os.path.join(output_path, "graphs", app, "graph.json")
+        if not os.path.exists(graph_path):
+            return None
+        return cls(
+            app,
+            os.path.join(output_path, "views", app),
+            graph_path,
+            os.path.join(output_path, "crawlers", app) + ".jsonl",
+        )
+
+    def get_view_path(self, uuid: str) -> str:
+        return os.path.join(self.views_dir, uuid) + ".json"
+
+    @staticmethod
+    def get_key(action: Action) -> ActionKey:
+        return get_action_key(action.input_type, action.desc, action.bounds)
+
+    def get_outcome(self, state_id: str, action_dict: Dict[str, Any]) -> Optional[str]:
+        # Every action in graph.json stayed in the app. None if the result was not captured.
+        if not action_dict["result_state"] or not action_dict["result_uuid"]:
+            return None
+        if action_dict["result_state"] == state_id:
+            return DEAD
+        return PRODUCTIVE
+
+    def load_journal_outcomes(self, journal_path: str) -> None:
+        # Out and prior records index into the actions of the state's first capture, as on
+        # replay. Prior records are logged before the capture of their state.
+        records = list(read_journal(journal_path))
+        treefiles: Dict[str, str] = {}
+        for record in records:
+            if record["type"] == "capture":
+                treefile = self.get_view_path(record["uuid"])
+                if record["state_id"] not in treefiles and os.path.exists(treefile):
+                    treefiles[record["state_id"]] = treefile
+
+        state_actions: Dict[str, List[Action]] = {}
+        for record in records:
+            if record["type"] == "out":
+                outcome = OUT_OF_APP
+            elif record["type"] == "prior":
+                outcome = record["outcome"]
+            else:
+                continue
+            src = record["src"]
+            if src not in state_actions:
+                if src not in treefiles:
+                    continue
+                state_actions[src] = State(treefile=treefiles[src], state_id=src).actions
+                self.known_actions[src].update(self.get_key(a) for a in state_actions[src])
+            if record["index"] >= len(state_actions[src]):
+                continue
+            key = self.get_key(state_actions[src][record["index"]])
+            self.explored_actions[src].add(key)
+            if self.outcomes[src].get(key) != PRODUCTIVE:
+                self.outcomes[src][key] = outcome
+
+    def get_num_actions(self, outcome: str) -> int:
+        return sum(
+            1 for outcomes in self.outcomes.values() for o in outcomes.values() if o == outcome
+        )
+
+    def apply(self, state: State, verify_only: bool = False) -> Dict[int, str]:
+        """
+        Raises the priority of the state's known-productive actions, and disables the ones
+        that previously left the screen unchanged or left the app. With verify_only, actions
+        the previous crawl saw on the screen but never explored are disabled as well, so only
+        the actions it explored and actions new in this version are explored. Returns the
+        outcome of each action disabled for its outcome, by action index.
+        """
+        outcomes = self.outcomes.get(state.state_id)
+        if outcomes is None:
+            return {}
+        unexplored_actions = (
+            self.known_actions[state.state_id] - self.explored_actions[state.state_id]
+        )
+        disabled_outcomes = {}
+        for i, action in enumerate(state.actions):
+            if action.priority < 0:
+                continue
+            key = self.get_key(action)
+            outcome = outcomes.get(key)
+            if outcome == PRODUCTIVE:
+                action.priority = WARM_START_PRIORITY
+            elif outcome in (DEAD, OUT_OF_APP):
+                state.disable_action(i)
+                disabled_outcomes[i] = outcome
+            elif verify_only and key in unexplored_actions:
+                state.disable_action(i)
+        return disabled_outcomes
@@ -0,0 +1,98 @@
+import configparser
+import logging
+import threading
+from typing import Optional
+
+import crawl.adb_utils as adb_utils
+import crawl.clock as clock
+
+from .crawler import Crawler
+
+# Recovery actions, in the order they are escalated through while a stall persists
+RECOVERY_ACTIONS = ["relaunch", "skip", "reboot"]
+RECOVERY_LOG_TEXT = {
+    "relaunch": "Relaunching",
+    "skip": "Crawl stopped",
+    "reboot": "Rebooting device",
+}
+
+
+class Watchdog:
+    """
+    Watches the crawls of one device from a background thread. A crawl has stalled when it
+    has neither discovered a state nor explored an action for `stall_timeout` seconds, or
+    when the screen is off or locked. Each stall escalates the recovery one step: relaunch
+    the app, then skip it, then reboot the device. An unresponsive device is rebooted
+    immediately. Recoveries are carried out by the crawl thread at its next device step
+    (see Crawler.check_interrupted), and the escalation resets once the crawl progresses.
+    """
+
+    def __init__(self, config: configparser.ConfigParser, device: str) -> None:
+        self.device = device
+        self.stall_timeout = config["crawl"].getfloat("stall_timeout", fallback=0)
+        self.interval = config["crawl"].getfloat("watchdog_interval", fallback=10.0)
+
+        self.crawler: Optional[Crawler] = None
+        # Progress time of the crawler when it started being watched. The escalation level
+        # carries over to the next app, and is only reset by progress after this point.
+        self.watch_start_time = 0.0
+        self.level = 0
+        self.last_escalation_time = clock.monotonic()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        if self.stall_timeout > 0:
+            self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def watch(self, crawler: Optional[Crawler]) -> None:
+        if crawler is not None:
+            self.watch_start_time = crawler.last_progress_time
+        self.crawler = crawler
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            crawler = self.crawler
+            if crawler is not None:
+                self.check(crawler)
+
+    def check(self, crawler: Crawler) -> None:
+        # The previous recovery has not been carried out yet, so escalating further would
+        # skip past it
+        if crawler.stall_action is not None:
+            return
+        now = clock.monotonic()
+        if crawler.last_progress_time > max(self.last_escalation_time, self.watch_start_time):
+            self.level = 0
+
+        idle = now - max(crawler.last_progress_time, self.last_escalation_time)
+        screen_state = adb_utils.probe_screen_state(self.device, timeout=self.interval)
+        if screen_state is None:
+            self.escalate(crawler, "reboot")
+            return
+        # A locked screen blocks all progress, so it does not wait for the idle time. It is
+        # still given stall_timeout after the last recovery to take effect.
+        is_locked = bool(screen_state) and "ON_UNLOCKED" not in screen_state
+        since_escalation = now - self.last_escalation_time
+        if idle >= self.stall_timeout or (is_locked and since_escalation >= self.stall_timeout):
+            action = RECOVERY_ACTIONS[min(self.level, len(RECOVERY_ACTIONS) - 1)]
+            self.escalate(crawler, action)
+
+    def escalate(self, crawler: Crawler, action: str) -> None:
+        # Reported as the time since the last progress, even if earlier recoveries happened
+        idle = clock.monotonic() - crawler.last_progress_time
+        logging.warning(
+            f"[{self.device}] Crawl of {crawler.app} v{crawler.version} stalled for "
+            f"{int(idle)} seconds. {RECOVERY_LOG_TEXT[action]}."
+        )
+        crawler.stall_action = action
+        # A freshly rebooted device starts again from the mildest recovery
+        self.level = 0 if action == "reboot" else self.level + 1
+        self.last_escalation_time = clock.monotonic()
+        if action != "relaunch" and self.crawler is crawler:
+            # Skips and reboots end the crawl, so there is nothing left to watch until the
+            # worker starts on its next app
+            self.crawler = None
@@ -0,0 +1,58 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+
+class BackgroundWriter:
+    """
+    Runs file writes on a single background thread, in the order they were submitted, so the
+    crawl loop does not wait on disk. Each failed write is logged, and later writes still run.
+    The first failure is raised on the next flush or close.
+    """
+
+    def __init__(self, device: str = "") -> None:
+        self.device = device
+        self.queue: "queue.Queue[Optional[Tuple[Callable[..., Any], Tuple[Any, ...], Any]]]" = (
+            queue.Queue()
+        )
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                func, args, kwargs = task
+                func(*args, **kwargs)
+            except BaseException as e:
+                logging.error(
+                    f"[{self.device}] Background write {getattr(func, '__name__', func)} "
+                    f"failed: {e!r}"
+                )
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        self.queue.put((func, args, kwargs))
+
+    def flush(self) -> None:
+        self.queue.join()
+        self.raise_error()
+
+    def close(self) -> None:
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
@@ -2,6 +2,7 @@ import hashlib
 import json
 from typing import Any, Dict, List, Optional, Set, Tuple
 
+from .capture import Capture
 from .utils import bfs
 
 __DEBUG = False
@@ -60,7 +61,10 @@ def check_state_equivalency_from_json(file0: str, file1: str) -> bool:
 def generate_xiaoyi_heuristics_obj(view_file: str) -> Dict[str, Any]:
     with open(view_file, "r") as f:
         root = json.load(f)
+    return generate_xiaoyi_heuristics_obj_for_root(root)
 
+
+def generate_xiaoyi_heuristics_obj_for_root(root: Any) -> Dict[str, Any]:
     class_names = set()
     resource_ids = set()
     for node in bfs(root):
@@ -85,6 +89,13 @@ def get_xiaoyi_state_id(view_file: str) -> Optional[str]:
         return None
 
 
+def get_xiaoyi_state_id_for_capture(capture: Capture) -> Optional[str]:
+    if capture.tree is None:
+        return None
+    obj = json.dumps(generate_xiaoyi_heuristics_obj_for_root(capture.tree), sort_keys=True)
+    return hashlib.md5(obj.encode("utf-8")).hexdigest()
+
+
 def get_bounds(node: Any) -> Tuple[int, int, int, int]:
     bounds = node["bounds"]
     tl = bounds.split("][")[0][1:]
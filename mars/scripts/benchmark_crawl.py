@@ -0,0 +1,181 @@
+import argparse
+import configparser
+import logging
+import os
+import random
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import crawl.adb_session as adb_session
+import crawl.clock as clock
+import crawl.errors as errors
+from crawl.crawler import Crawler
+from crawl.simulator import CrawlRecording, SimulatedDevice
+
+DEFAULT_STRATEGIES = ["priority:scheduler=priority", "cost:scheduler=cost"]
+COVERAGE_MILESTONES = [0.5, 0.9, 1.0]
+
+
+def parse_strategy(strategy: str) -> Tuple[str, Dict[str, str]]:
+    # "name:key=value,key=value" overrides [crawl] options of the benchmark config
+    name, _, overrides = strategy.partition(":")
+    options = {}
+    for override in overrides.split(","):
+        if override:
+            key, _, value = override.partition("=")
+            options[key.strip()] = value.strip()
+    return name, options
+
+
+def get_strategy_config(
+    config: configparser.ConfigParser, output_path: str, options: Dict[str, str]
+) -> configparser.ConfigParser:
+    crawl_options = {key: config["crawl"][key] for key in config["crawl"]}
+    crawl_options.update(
+        output_path=output_path,
+        crawlers_path=os.path.join(output_path, "crawlers"),
+        graphs_path=os.path.join(output_path, "graphs"),
+        views_path=os.path.join(output_path, "views"),
+        apks_path=os.path.join(output_path, "apks"),
+        screenshots_path=os.path.join(output_path, "screenshots"),
+        # Nothing runs in the background of a benchmark crawl
+        stall_timeout="0",
+    )
+    crawl_options.update(options)
+    strategy_config = configparser.ConfigParser(interpolation=None)
+    strategy_config.read_dict({"crawl": crawl_options})
+    return strategy_config
+
+
+def run_strategy(
+    config: configparser.ConfigParser,
+    recording: CrawlRecording,
+    name: str,
+    options: Dict[str, str],
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    sim_clock = clock.SimulatedClock()
+    clock.set_clock(sim_clock)
+    device = f"sim-{name}"
+    simulated_device = SimulatedDevice(
+        recording,
+        sim_clock,
+        action_latency=args.action_latency,
+        launch_latency=args.launch_latency,
+    )
+    adb_session.register_backend(device, simulated_device)
+    # The crawl's views, screenshots, journal and metrics go to a throwaway directory
+    random.seed(args.seed)
+    end_reason = "completed"
+    with tempfile.TemporaryDirectory() as output_path:
+        strategy_config = get_strategy_config(config, output_path, options)
+        crawl_instance = Crawler(strategy_config, device, recording.app)
+        crawl_instance.deadline = sim_clock.monotonic() + args.time_limit
+        try:
+            crawl_instance.prepare_device_for_crawl()
+            crawl_instance.crawl()
+        except TimeoutError:
+            end_reason = "time limit"
+        except errors.CoveragePlateauError:
+            end_reason = "plateaued"
+        finally:
+            crawl_instance.on_crawl_terminate()
+            adb_session.unregister_backend(device)
+            clock.set_clock(clock.Clock())
+
+    return {
+        "name": name,
+        "end_reason": end_reason,
+        "sim_time": sim_clock.monotonic(),
+        "captured": simulated_device.captured,
+        "num_screens": len(recording.screens),
+        "explored_actions": crawl_instance.get_num_explored_actions(),
+    }
+
+
+def get_coverage_at(result: Dict[str, Any], sim_time: float) -> float:
+    covered = sum(1 for t in result["captured"].values() if t <= sim_time)
+    return covered / max(1, result["num_screens"])
+
+
+def get_time_to_coverage(result: Dict[str, Any], fraction: float) -> str:
+    times = sorted(result["captured"].values())
+    needed = int(fraction * result["num_screens"] + 0.999999)
+    if needed == 0:
+        return "0s"
+    if len(times) < needed:
+        return "-"
+    return f"{times[needed - 1]:.0f}s"
+
+
+def print_report(results: List[Dict[str, Any]], interval: float) -> None:
+    print("Coverage of the recorded screens against simulated crawl time")
+    milestones = " | ".join(f"to {int(m * 100)}%" for m in COVERAGE_MILESTONES)
+    print(f"strategy | end | sim time | actions | screens | {milestones}")
+    for result in results:
+        times = " | ".join(get_time_to_coverage(result, m) for m in COVERAGE_MILESTONES)
+        print(
+            f"{result['name']} | {result['end_reason']} | {result['sim_time']:.0f}s | "
+            f"{result['explored_actions']} | {len(result['captured'])}/{result['num_screens']} | "
+            f"{times}"
+        )
+
+    print()
+    print("sim time | " + " | ".join(result["name"] for result in results))
+    end_time = max(result["sim_time"] for result in results)
+    sim_time = interval
+    while True:
+        coverages = " | ".join(
+            f"{100 * get_coverage_at(result, sim_time):.0f}%" for result in results
+        )
+        print(f"{sim_time:.0f}s | {coverages}")
+        if sim_time >= end_time:
+            break
+        sim_time += interval
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark crawl strategies against a simulated device that replays a "
+        "recorded crawl of an app.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--config", help="Path to config file.", default="config.ini", type=str)
+    parser.add_argument("--app", help="App whose recorded crawl is replayed.", required=True)
+    parser.add_argument(
+        "--strategy",
+        help='Strategy to benchmark, as "name:key=value,...", where the keys are [crawl] '
+        "options. Can be repeated.",
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "--time_limit", help="Simulated seconds per crawl.", default=3600.0, type=float
+    )
+    parser.add_argument(
+        "--interval", help="Simulated seconds between coverage rows.", default=60.0, type=float
+    )
+    parser.add_argument(
+        "--action_latency",
+        help="Simulated seconds for a screen transition.",
+        default=1.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--launch_latency", help="Simulated seconds for an app launch.", default=3.0, type=float
+    )
+    parser.add_argument("--seed", help="Random seed of each crawl.", default=0, type=int)
+    parser.add_argument("--verbose", help="Log every crawl step.", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
+    config.read(args.config)
+
+    recording = CrawlRecording.from_config(config, args.app)
+    results = [
+        run_strategy(config, recording, *parse_strategy(strategy), args)
+        for strategy in args.strategy or DEFAULT_STRATEGIES
+    ]
+    print_report(results, args.interval)
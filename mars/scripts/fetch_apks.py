@@ -5,15 +5,15 @@ from typing import List
 
 import crawl.adb_utils as adb_utils
 import crawl.log_utils as log_utils
+from crawl.packages import PackageIndex
 
 
 def fetch_apks(apps: List[str], savedir: str) -> None:
     os.makedirs(savedir, exist_ok=True)
-    devices = adb_utils.get_connected_devices()
+    package_index = PackageIndex(adb_utils.get_connected_devices())
     for app in apps:
-        for device in devices:
-            if adb_utils.is_app_installed(device, app):
-                adb_utils.pull_apk_from_device(device, app, savedir, verbose=True)
+        for device in package_index.get_devices_with_app(app):
+            adb_utils.pull_apk_from_device(device, app, savedir, verbose=True)
 
 
 if __name__ == "__main__":
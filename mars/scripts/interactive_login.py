@@ -10,6 +10,7 @@ import subprocess
 import sys
 
 import crawl.adb_utils as adb_utils
+from crawl.packages import PackageIndex
 
 
 def main():
@@ -51,11 +52,10 @@ def main():
             raise Exception(f"{args.start_app} not in list of apps")
     else:
         start_index = 0
+    package_index = PackageIndex(devices)
     i = start_index
     for app in apps[start_index:]:
-        for device in devices:
-            if not adb_utils.is_app_installed(device, app):
-                continue
+        for device in package_index.get_devices_with_app(app):
             adb_utils.unlock_device(device)
             proc = subprocess.Popen(
                 [f"adb -s {device} shell monkey -p {app} 1"],
@@ -5,6 +5,7 @@ import os
 import sys
 
 from crawl.crawl_controller import CrawlController
+from crawl.threaded_controller import ThreadedCrawlController
 
 
 def start_crawl_cli() -> None:
@@ -34,6 +35,12 @@ def start_crawl_cli() -> None:
         help="Set to crawl exactly the apps specified in --crawl_list",
         action="store_true",
     )
+    parser.add_argument(
+        "--engine",
+        help="Run one crawl process per device, or one crawl thread per device",
+        choices=["process", "threaded"],
+        default="process",
+    )
     args = parser.parse_args()
 
     if not args.app and not os.path.exists(args.crawl_list):
@@ -59,7 +66,11 @@ def start_crawl_cli() -> None:
         level=logging.DEBUG,
     )
 
-    crawl_controller = CrawlController(args, config)
+    crawl_controller: CrawlController
+    if args.engine == "threaded":
+        crawl_controller = ThreadedCrawlController(args, config)
+    else:
+        crawl_controller = CrawlController(args, config)
 
 
 if __name__ == "__main__":
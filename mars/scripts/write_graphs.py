@@ -0,0 +1,38 @@
+import argparse
+import configparser
+import os
+import re
+
+from crawl.journal import write_graph
+
+# <app>.jsonl for the latest version, <app>__<version>.jsonl for earlier ones
+JOURNAL_PATTERN = r"(?P<app>\S+?)(?:__(?P<version>\d+))?\.jsonl$"
+
+
+def write_graphs(cfg: configparser.ConfigParser) -> None:
+    crawlers_path = cfg["crawl"]["crawlers_path"]
+    for filename in sorted(os.listdir(crawlers_path)):
+        match = re.match(JOURNAL_PATTERN, filename)
+        if not match:
+            continue
+        app, version = match.group("app"), match.group("version")
+        graphs_path = os.path.join(cfg["crawl"]["graphs_path"], app)
+        os.makedirs(graphs_path, exist_ok=True)
+        graph_filename = f"graph__{version}.json" if version else "graph.json"
+        graph_file_path = os.path.join(graphs_path, graph_filename)
+        write_graph(os.path.join(crawlers_path, filename), graph_file_path)
+        print(f"Wrote {graph_file_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write every app's graph.json from its crawl journals, e.g. after crawls "
+        "were killed before they could write their graphs."
+    )
+    parser.add_argument("--config", help="Path to config file.", default="config.ini", type=str)
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
+    config.read(args.config)
+
+    write_graphs(config)
@@ -0,0 +1,120 @@
+import configparser
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List
+
+import pytest
+
+import crawl.adb_session as adb_session
+import crawl.clock as clock
+from crawl.simulator import CrawlRecording, SimulatedDevice
+
+APP = "com.example.app"
+DEVICE = "sim-test"
+# A recorded app: each screen's buttons, and the screen each one led to. "web" is a screen
+# of another app, so it has no view, and "item to item" leaves the screen unchanged.
+SCREENS: Dict[str, List[str]] = {
+    "home": ["list", "settings", "about"],
+    "list": ["item", "about"],
+    "settings": ["web", "list"],
+    "item": ["list", "item"],
+    "about": [],
+}
+
+
+def get_button_label(screen: str, target: str) -> str:
+    return f"{screen} to {target}"
+
+
+def get_view(screen: str) -> Dict[str, Any]:
+    def node(class_name: str, resource_id: str, bounds: str, text: str) -> Dict[str, Any]:
+        return {
+            "className": class_name,
+            "resourceId": resource_id,
+            "bounds": bounds,
+            "screenWidth": 1080,
+            "screenHeight": 1920,
+            "contentDesc": "",
+            "text": text,
+            "hintText": "",
+            "packageName": APP,
+            "isClickable": bool(text),
+            "isFocusable": bool(text),
+            "isVisibleToUser": True,
+            "isImportantForAccessibility": True,
+            "isFocused": False,
+            "isSelected": False,
+            "isChecked": False,
+            "children": [],
+        }
+
+    root = node("android.widget.FrameLayout", f"{APP}:id/{screen}", "[0,0][1080,1920]", "")
+    for i, target in enumerate(SCREENS[screen]):
+        bounds = f"[0,{i * 200}][1080,{i * 200 + 200}]"
+        label = get_button_label(screen, target)
+        button_id = f"{APP}:id/{screen}_{target}"
+        root["children"].append(node("android.widget.Button", button_id, bounds, label))
+    return root
+
+
+@pytest.fixture
+def recording(tmp_path: Any) -> CrawlRecording:
+    views_dir = tmp_path / "recording" / "views"
+    views_dir.mkdir(parents=True)
+    graph: Dict[str, List[Dict[str, Any]]] = {}
+    for screen, targets in SCREENS.items():
+        with open(views_dir / f"{screen}.json", "w") as f:
+            json.dump(get_view(screen), f)
+        graph[screen] = [
+            {
+                "input_type": "touch",
+                "desc": get_button_label(screen, target),
+                "bounds": f"[0,{i * 200}][1080,{i * 200 + 200}]",
+                "result_uuid": target,
+            }
+            for i, target in enumerate(targets)
+        ]
+    graph_path = tmp_path / "recording" / "graph.json"
+    with open(graph_path, "w") as f:
+        json.dump(graph, f)
+    return CrawlRecording(APP, str(views_dir), str(tmp_path / "screenshots"), str(graph_path))
+
+
+@pytest.fixture
+def sim_clock() -> Iterator[clock.SimulatedClock]:
+    sim_clock = clock.SimulatedClock()
+    clock.set_clock(sim_clock)
+    yield sim_clock
+    clock.set_clock(clock.Clock())
+
+
+@pytest.fixture
+def device(recording: CrawlRecording, sim_clock: clock.SimulatedClock) -> Iterator[str]:
+    adb_session.register_backend(DEVICE, SimulatedDevice(recording, sim_clock))
+    yield DEVICE
+    adb_session.unregister_backend(DEVICE)
+
+
+@pytest.fixture
+def make_config(tmp_path: Any) -> Callable[..., configparser.ConfigParser]:
+    # Config of a crawl whose output goes to its own directory under tmp_path
+    def make(name: str = "crawl", **options: str) -> configparser.ConfigParser:
+        output_path = str(tmp_path / name)
+        crawl_options = {
+            "output_path": output_path,
+            "crawlers_path": os.path.join(output_path, "crawlers"),
+            "graphs_path": os.path.join(output_path, "graphs"),
+            "views_path": os.path.join(output_path, "views"),
+            "apks_path": os.path.join(output_path, "apks"),
+            "screenshots_path": os.path.join(output_path, "screenshots"),
+            "full_crawl_timeout": "3600",
+            "start_app_delay": "3",
+            "exec_action_delay": "1",
+            "stall_timeout": "0",
+        }
+        crawl_options.update(options)
+        config = configparser.ConfigParser(interpolation=None)
+        config.read_dict({"crawl": crawl_options})
+        return config
+
+    return make
@@ -0,0 +1,45 @@
+from crawl.clock import SimulatedClock
+from crawl.coverage import CoverageMonitor
+
+
+def test_crawl_plateaus_once_discoveries_leave_the_window() -> None:
+    clock = SimulatedClock()
+    monitor = CoverageMonitor(window=60, min_rate=2, clock=clock.monotonic)
+    monitor.record_discovery(new_states=1, new_actions=2)
+    clock.advance(30)
+    # Nothing is judged before a full window has passed
+    assert not monitor.has_plateaued()
+
+    clock.advance(30)
+    assert not monitor.has_plateaued()
+    assert monitor.get_discovery_rate() == 3.0
+
+    clock.advance(1)
+    assert monitor.get_discovery_rate() == 0.0
+    assert monitor.has_plateaued()
+
+
+def test_rate_is_measured_over_the_trailing_window() -> None:
+    clock = SimulatedClock()
+    monitor = CoverageMonitor(window=60, min_rate=2, clock=clock.monotonic)
+    for _ in range(4):
+        clock.advance(30)
+        monitor.record_discovery(new_states=0, new_actions=1)
+    # The discoveries at 60, 90 and 120 seconds are inside the window
+    assert monitor.get_discovery_rate() == 3.0
+    assert not monitor.has_plateaued()
+
+
+def test_empty_discoveries_are_not_recorded() -> None:
+    clock = SimulatedClock()
+    monitor = CoverageMonitor(window=60, min_rate=1, clock=clock.monotonic)
+    monitor.record_discovery(new_states=0, new_actions=0)
+    clock.advance(60)
+    assert monitor.has_plateaued()
+
+
+def test_window_of_zero_disables_plateau_detection() -> None:
+    clock = SimulatedClock()
+    monitor = CoverageMonitor(window=0, min_rate=1, clock=clock.monotonic)
+    clock.advance(3600)
+    assert not monitor.has_plateaued()
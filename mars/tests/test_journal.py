@@ -0,0 +1,122 @@
+import json
+from typing import Any, Dict, Set, Tuple
+
+import pytest
+
+import crawl.clock as clock
+from crawl.crawler import Crawler
+from crawl.journal import CrawlJournal, read_graph, read_journal
+from crawl.simulator import CrawlRecording
+
+
+def describe_crawler(crawler: Crawler) -> Dict[str, Any]:
+    # Everything a restored crawl continues from
+    return {
+        "states": {
+            state_id: [
+                action.result_state.state_id if action.result_state else None
+                for action in state.actions
+            ]
+            for state_id, state in crawler.vertices.items()
+        },
+        "edges": {
+            state.state_id: [(a.desc, s.state_id) for a, s in pairs]
+            for state, pairs in crawler.edges.items()
+        },
+        "out_states": crawler.out_states,
+        "frontier": list(crawler.frontier),
+        "num_explored_actions": crawler.get_num_explored_actions(),
+        "num_unexplored_actions": crawler.get_num_unexplored_actions(),
+        "global_explored_actions": crawler.global_explored_actions,
+    }
+
+
+def get_graph_edges(graph: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    # Captures get new uuids in every crawl, so edges are compared by action and result state
+    return {(a["desc"], a["result_state"]) for actions in graph.values() for a in actions}
+
+
+def run_crawl(crawler: Crawler, time_limit: float) -> None:
+    crawler.deadline = clock.monotonic() + time_limit
+    crawler.prepare_device_for_crawl()
+    crawler.crawl()
+
+
+def test_read_journal_stops_at_a_torn_record(tmp_path: Any) -> None:
+    path = str(tmp_path / "app.jsonl")
+    journal = CrawlJournal(path)
+    journal.append("start", version="1")
+    journal.append("launch", state_id="a", latency=1.0)
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"type": "capture", "uu')
+
+    records = list(read_journal(path))
+    assert [r["type"] for r in records] == ["start", "launch"]
+    assert records[1] == {"type": "launch", "state_id": "a", "latency": 1.0}
+
+
+def test_killed_crawl_is_rebuilt_from_its_journal(
+    recording: CrawlRecording, device: str, make_config: Any
+) -> None:
+    config = make_config("killed")
+    crawler = Crawler(config, device, recording.app)
+    with pytest.raises(TimeoutError):
+        run_crawl(crawler, time_limit=15)
+    # Killed without on_crawl_terminate. Only the records already queued reach the journal.
+    crawler.writer.flush()
+    assert crawler.journal is not None
+    crawler.journal.close()
+    assert 0 < crawler.get_num_explored_actions()
+    assert crawler.get_num_unexplored_actions() > 0
+
+    restored = Crawler(config, device, recording.app)
+    assert describe_crawler(restored) == describe_crawler(crawler)
+
+    # The graph can be written from the journal alone, and matches the crawler's edges
+    graph = read_graph(restored.journal_path)
+    expected = {
+        state.uuid: [a.desc for a, _ in pairs if a.action_type != "back"]
+        for state, pairs in crawler.edges.items()
+    }
+    assert {uuid: [a["desc"] for a in actions] for uuid, actions in graph.items()} == {
+        uuid: descs for uuid, descs in expected.items() if descs
+    }
+
+    # Once resumed, the crawl ends with the same graph as one that was never interrupted
+    run_crawl(restored, time_limit=3600)
+    restored.on_crawl_terminate()
+    uninterrupted = Crawler(make_config("uninterrupted"), device, recording.app)
+    run_crawl(uninterrupted, time_limit=3600)
+    uninterrupted.on_crawl_terminate()
+    with open(restored.get_graph_path()) as f:
+        restored_graph = json.load(f)
+    with open(uninterrupted.get_graph_path()) as f:
+        uninterrupted_graph = json.load(f)
+    assert get_graph_edges(restored_graph) == get_graph_edges(uninterrupted_graph)
+    # Every button of the recording except the one that leaves the app
+    assert len(get_graph_edges(restored_graph)) == 8
+
+
+def test_graph_of_a_previous_version_is_kept(
+    recording: CrawlRecording, device: str, make_config: Any
+) -> None:
+    config = make_config()
+    crawler = Crawler(config, device, recording.app)
+    run_crawl(crawler, time_limit=3600)
+    crawler.on_crawl_terminate()
+    with open(crawler.get_graph_path()) as f:
+        graph = json.load(f)
+
+    # The same journal, as if it had been written for an earlier version of the app
+    records = list(read_journal(crawler.journal_path))
+    with open(crawler.journal_path, "w") as f:
+        for record in records:
+            if record["type"] == "start":
+                record["version"] = "0"
+            f.write(json.dumps(record) + "\n")
+
+    updated = Crawler(config, device, recording.app)
+    assert not updated.vertices
+    with open(updated.get_graph_path("graph__0.json")) as f:
+        assert json.load(f) == graph
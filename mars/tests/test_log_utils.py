@@ -0,0 +1,36 @@
+from typing import Any
+
+from crawl import log_utils
+
+LOG = """\
+2021-01-01 10:00:00,000:INFO:42: [DEV1] Starting crawl of com.a v1
+2021-01-01 10:05:00,000:INFO:42: [DEV1] Crawl of com.a v1 plateaued at 0.50 discoveries \
+per minute over the last 120 seconds. Crawl stopped.
+2021-01-01 10:06:00,000:INFO:42: [DEV1] Starting crawl of com.b v3
+2021-01-01 10:07:00,000:WARNING:42: [DEV1] Crawl of com.b v3 stalled for 60 seconds. Relaunching.
+2021-01-01 10:09:00,000:WARNING:42: [DEV1] Crawl of com.b v3 stalled for 60 seconds. \
+Crawl stopped.
+2021-01-01 10:10:00,000:INFO:42: [DEV1] Starting crawl of com.c v2
+2021-01-01 10:10:30,000:WARNING:42: [DEV1] Crawl of com.c v2 stalled for 30 seconds. Relaunching.
+"""
+
+
+def write_device_log(tmp_path: Any) -> str:
+    split_logs_dir = tmp_path / "split_logs"
+    split_logs_dir.mkdir()
+    (split_logs_dir / "DEV1.log").write_text(LOG)
+    return str(split_logs_dir)
+
+
+def test_plateaued_and_stalled_crawls_are_classified(tmp_path: Any) -> None:
+    status = log_utils.get_apps_status(write_device_log(tmp_path))
+    assert status["plateaued"] == ["com.a"]
+    # A skip after a stall ends the crawl, while a relaunch continues it
+    assert status["failed"] == ["com.b"]
+    assert status["completed"] == []
+    assert status["timed_out"] == []
+
+
+def test_crawl_time_ends_at_plateaus_and_skips(tmp_path: Any) -> None:
+    crawl_times = log_utils.get_crawl_times(write_device_log(tmp_path))
+    assert crawl_times == {"com.a": 300, "com.b": 180}
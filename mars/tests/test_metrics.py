@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+from typing import Any, Dict
+
+from crawl.clock import SimulatedClock
+from crawl.control_server import format_prometheus
+from crawl.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_include_their_upper_bound() -> None:
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 1.0, 5.0):
+        histogram.observe(value)
+    h = histogram.as_dict()
+    assert h["buckets"] == {"0.1": 2, "1.0": 4, "+Inf": 5}
+    assert h["count"] == 5
+    assert h["sum"] == 6.65
+    assert h["mean"] == 6.65 / 5
+
+
+def test_timers_and_rates_use_the_crawl_clock() -> None:
+    clock = SimulatedClock()
+    metrics = Metrics("DEV1", "com.a", "1", clock=clock.monotonic)
+    with metrics.timer("wait"):
+        clock.advance(2.0)
+    metrics.increment("captures", 3)
+    clock.advance(28.0)
+
+    m = metrics.as_dict()
+    assert m["phases"]["wait"]["sum"] == 2.0
+    assert m["phases"]["wait"]["buckets"]["2.5"] == 1
+    assert m["rates"]["captures_per_minute"] == 6.0
+    assert m["rates"]["new_states_per_minute"] == 0.0
+
+
+def make_controller(crawl_metrics: Dict[str, Any]) -> Any:
+    worker = SimpleNamespace(
+        device="DEV1",
+        get_status=lambda: "crawling",
+        get_app=lambda: "com.a",
+        get_version=lambda: "1",
+        get_num_queued=lambda: 4,
+    )
+    return SimpleNamespace(workers=[worker], get_worker_metrics=lambda w: crawl_metrics)
+
+
+def test_prometheus_output_groups_samples_by_family() -> None:
+    clock = SimulatedClock()
+    metrics = Metrics("DEV1", "com.a", "1", clock=clock.monotonic)
+    for phase, seconds in (("wait", 0.3), ("capture", 12.0), ("wait", 0.7)):
+        metrics.observe(phase, seconds)
+    metrics.increment("captures")
+    clock.advance(60)
+
+    lines = format_prometheus(make_controller(metrics.as_dict())).splitlines()
+    assert lines.count("# TYPE mars_crawl_phase_seconds histogram") == 1
+    assert 'mars_worker_queued_apps{device="DEV1"} 4' in lines
+    assert 'mars_crawl_events_total{device="DEV1",app="com.a",event="captures"} 1' in lines
+
+    wait_buckets = [
+        line
+        for line in lines
+        if line.startswith("mars_crawl_phase_seconds_bucket") and "wait" in line
+    ]
+    # Numeric bucket order, ending with +Inf, although the bounds are strings in the file
+    assert wait_buckets[0].endswith('le="0.05"} 0')
+    assert wait_buckets[4].endswith('le="1.0"} 2')
+    assert wait_buckets[-1].endswith('le="+Inf"} 2')
+    assert 'mars_crawl_phase_seconds_count{device="DEV1",app="com.a",phase="capture"} 1' in lines
+
+
+def test_workers_without_crawl_metrics_only_report_their_status() -> None:
+    text = format_prometheus(make_controller({}))
+    assert 'status="crawling"' in text
+    assert "mars_crawl_" not in text
@@ -0,0 +1,77 @@
+from typing import Optional
+
+from crawl.graph_objects import Action, State
+from crawl.routing import Router
+
+
+def make_state(state_id: str) -> State:
+    return State(treefile=f"{state_id}.json", state_id=state_id, extract_actions=False)
+
+
+def make_action(desc: str, latency: Optional[float] = None) -> Action:
+    action = Action(desc, "Button", "", "click", "touch", "[0,0][10,10]", None, 0)
+    action.latency = latency
+    return action
+
+
+def test_new_edges_are_relaxed_into_cached_trees() -> None:
+    a, b, c = make_state("a"), make_state("b"), make_state("c")
+    router = Router(default_latency=1.0)
+    a_to_b, b_to_c, a_to_c = make_action("b", 1.0), make_action("c", 1.0), make_action("ac", 5.0)
+    router.add_edge(a, a_to_b, b)
+    router.add_edge(a, a_to_c, c)
+    assert router.find_path(a, c) == [a_to_c]
+
+    # The tree of a is cached now, and must pick up the shorter route through b
+    router.add_edge(b, b_to_c, c)
+    assert "a" in router.trees
+    assert router.find_path(a, c) == [a_to_b, b_to_c]
+    assert router.get_distance(a, c) == 2.0
+
+
+def test_unmeasured_actions_use_the_default_latency() -> None:
+    a, b = make_state("a"), make_state("b")
+    router = Router(default_latency=3.0)
+    router.add_edge(a, make_action("b"), b)
+    assert router.get_distance(a, b) == 3.0
+
+
+def test_only_the_fastest_action_between_two_states_is_kept() -> None:
+    a, b = make_state("a"), make_state("b")
+    router = Router(default_latency=1.0)
+    fast, slow = make_action("fast", 1.0), make_action("slow", 4.0)
+    router.add_edge(a, fast, b)
+    router.add_edge(a, slow, b)
+    assert router.find_path(a, b) == [fast]
+
+
+def test_trees_through_a_slower_edge_are_dropped_and_rebuilt() -> None:
+    a, b, c = make_state("a"), make_state("b"), make_state("c")
+    router = Router(default_latency=1.0)
+    a_to_b, b_to_c, a_to_c = make_action("b", 1.0), make_action("c", 1.0), make_action("ac", 3.0)
+    router.add_edge(a, a_to_b, b)
+    router.add_edge(b, b_to_c, c)
+    router.add_edge(a, a_to_c, c)
+    assert router.find_path(a, c) == [a_to_b, b_to_c]
+
+    b_to_c.latency = 5.0
+    router.add_edge(b, b_to_c, c)
+    assert "a" not in router.trees
+    assert router.find_path(a, c) == [a_to_c]
+
+
+def test_self_loops_and_unreachable_states_have_no_path() -> None:
+    a, b = make_state("a"), make_state("b")
+    router = Router(default_latency=1.0)
+    router.add_edge(a, make_action("a"), a)
+    assert router.find_path(a, b) == []
+    assert router.get_distance(a, b) is None
+
+
+def test_the_root_tree_is_never_evicted() -> None:
+    states = [make_state(s) for s in "abcd"]
+    router = Router(default_latency=1.0, max_trees=2)
+    router.set_root(states[0])
+    for state in states:
+        router.get_tree(state.state_id)
+    assert list(router.trees) == ["a", "d"]
@@ -0,0 +1,33 @@
+import threading
+
+from crawl.task_board import TaskBoard, order_longest_first
+
+
+def test_apps_are_ordered_by_their_capped_crawl_time() -> None:
+    tasks = [("short", ["d1"]), ("long", ["d1"]), ("capped", ["d1"])]
+    crawl_times = {"short": 100, "long": 900, "capped": 5000}
+    ordered = order_longest_first(tasks, crawl_times, cap=1000)
+    assert [app for app, _ in ordered] == ["capped", "long", "short"]
+
+
+def test_apps_without_history_take_the_median_time() -> None:
+    tasks = [("new", ["d1"]), ("fast", ["d1"]), ("medium", ["d1"]), ("slow", ["d1"])]
+    crawl_times = {"fast": 100, "medium": 500, "slow": 900, "failed": 0}
+    ordered = order_longest_first(tasks, crawl_times, cap=1000)
+    # The median, 500, ties with medium, and sorting keeps the original order of ties
+    assert [app for app, _ in ordered] == ["slow", "new", "medium", "fast"]
+
+
+def test_apps_are_assumed_to_reach_the_cap_without_any_history() -> None:
+    tasks = [("a", ["d1"]), ("b", ["d1"])]
+    assert order_longest_first(tasks, {}, cap=1000) == tasks
+
+
+def test_devices_only_claim_apps_installed_on_them() -> None:
+    board = TaskBoard([("a", ["d1"]), ("b", ["d2"]), ("c", ["d1", "d2"])], threading.Lock())
+    assert board.get_num_claimable("d2") == 2
+    assert board.claim("d2") == "b"
+    assert board.claim("d1") == "a"
+    assert board.claim("d1") == "c"
+    assert board.claim("d2") is None
+    assert board.get_num_claimable("d1") == 0
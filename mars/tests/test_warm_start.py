@@ -0,0 +1,39 @@
+from typing import Any, List
+
+import crawl.clock as clock
+from crawl.crawler import Crawler
+from crawl.simulator import CrawlRecording
+from crawl.warm_start import DEAD, OUT_OF_APP, PRODUCTIVE
+
+
+def run_crawl(crawler: Crawler) -> None:
+    crawler.deadline = clock.monotonic() + 3600
+    crawler.prepare_device_for_crawl()
+    crawler.crawl()
+    crawler.on_crawl_terminate()
+
+
+def get_num_outcomes(crawler: Crawler) -> List[int]:
+    assert crawler.prior is not None
+    return [crawler.prior.get_num_actions(o) for o in (PRODUCTIVE, DEAD, OUT_OF_APP)]
+
+
+def test_warm_starts_can_be_chained(
+    recording: CrawlRecording, device: str, make_config: Any
+) -> None:
+    first = Crawler(make_config("first"), device, recording.app)
+    run_crawl(first)
+    assert first.out_states
+
+    second_config = make_config("second", warm_start_path=first.config["crawl"]["output_path"])
+    second = Crawler(second_config, device, recording.app)
+    assert get_num_outcomes(second) == [7, 1, 1]
+    run_crawl(second)
+    # The dead and out-of-app actions were skipped, so they are not in this crawl's graph
+    assert not second.out_states
+    for state, pairs in second.edges.items():
+        assert all(next_state != state for _, next_state in pairs)
+
+    third_config = make_config("third", warm_start_path=second.config["crawl"]["output_path"])
+    third = Crawler(third_config, device, recording.app)
+    assert get_num_outcomes(third) == [7, 1, 1]